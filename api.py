@@ -1,85 +1,33 @@
-from flask import Blueprint, jsonify, request, session  # session added for auth
-from flask import Flask
+from flask import Blueprint, jsonify, request, session, make_response, g, Response, stream_with_context  # session added for auth
 import sqlite3
 import os
 import bcrypt
 import jwt
-import re
+import csv
+import io
+import json
 from datetime import datetime, timedelta
 from functools import wraps
-from flask_cors import CORS
+from db import connect_db, execute_write
+from popularity import top_products
+import change_log
+import similar
+import media
+import deletions
+# SQL Injection Protection Functions (patterns and schemas compiled once at import)
+from validation import (
+    sanitize_input, validate_field_name, validate_email, validate_numeric_input,
+    Field, compile_schema, validation_error
+)
 
 
 api_bp = Blueprint('api', __name__)
-app = Flask(__name__)
-app.secret_key = 'ef4072ab74fab1912276e53ff09198eb82ed8f0a4f470dfd60d68bb1a596ee12'  # import secrets; print(secrets.token_hex(x))
-CORS(app, expose_headers='Authorization')
 
 # JWT Configuration
-SECRET_KEY = 'ef4072ab74fab1912276e53ff09198eb82ed8f0a4f470dfd60d68bb1a596ee12'  # Use the same as app.secret_key
+SECRET_KEY = os.environ.get('SECRET_KEY', 'ef4072ab74fab1912276e53ff09198eb82ed8f0a4f470dfd60d68bb1a596ee12')  # Use the same as app.secret_key
 ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_SECONDS = 1800 #0 Token validity in seconds (e.g., 1800 for 30 minutes)
 
-# SQL Injection Protection Functions
-def sanitize_input(input_string):
-    """
-    Sanitize input to prevent SQL injection attacks.
-    This is an additional layer of protection alongside parameterized queries.
-    """
-    if not isinstance(input_string, str):
-        return input_string
-    
-    # Remove or escape potentially dangerous characters
-    dangerous_patterns = [
-        r"[';\"\\]",  # Single quotes, double quotes, backslashes
-        r"--",        # SQL comments
-        r"/\*.*?\*/", # Multi-line comments
-        r"\bUNION\b", r"\bSELECT\b", r"\bINSERT\b", r"\bUPDATE\b", 
-        r"\bDELETE\b", r"\bDROP\b", r"\bCREATE\b", r"\bALTER\b",
-        r"\bEXEC\b", r"\bEXECUTE\b"
-    ]
-    
-    sanitized = input_string
-    for pattern in dangerous_patterns:
-        sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
-    
-    return sanitized.strip()
-
-def validate_field_name(field_name):
-    """
-    Validate that field names are safe for dynamic query building.
-    Only allow alphanumeric characters and underscores.
-    """
-    if not isinstance(field_name, str):
-        return False
-    
-    # Only allow alphanumeric characters and underscores
-    return bool(re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', field_name))
-
-def validate_email(email):
-    """
-    Validate email format to prevent injection through email field.
-    """
-    if not isinstance(email, str):
-        return False
-    
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(email_pattern, email))
-
-def validate_numeric_input(value, min_val=None, max_val=None):
-    """
-    Validate numeric inputs to prevent injection and ensure data integrity.
-    """
-    try:
-        num_value = float(value)
-        if min_val is not None and num_value < min_val:
-            return False
-        if max_val is not None and num_value > max_val:
-            return False
-        return True
-    except (ValueError, TypeError):
-        return False
-
 # JWT Helper Functions
 def generate_access_token(user_id, email, user_type):
     payload = {
@@ -117,22 +65,99 @@ def token_required(f):
         if isinstance(payload, dict) and payload.get('error'):
             return jsonify({'error': payload['error']}), 401
 
-        # Optionally, attach payload to request context for use in views
-        # from flask import g
-        # g.jwt_payload = payload
+        # Attach payload to request context for use in views
+        g.jwt_payload = payload
 
         return f(*args, **kwargs)
     return decorated
 
+def admin_required(f):
+    """
+    Must be applied after token_required: rejects tokens that are not admin.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        payload = getattr(g, 'jwt_payload', None) or {}
+        if payload.get('type') != 'admin':
+            return jsonify({'error': 'Admin privileges required'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+def token_owner():
+    """
+    User id the token's writes are restricted to, or None for an admin token.
+    """
+    payload = g.jwt_payload
+    return None if payload.get('type') == 'admin' else payload.get('user_id')
+
 # Helper function to create a database connection
 def get_db_connection():
-    conn = sqlite3.connect('database.db')
+    conn = connect_db()
     conn.row_factory = sqlite3.Row
     return conn
 
+# Conditional GET helpers (ETag / Last-Modified from table_versions)
+def get_table_versions(tables):
+    """
+    Return {tableName: (version, updatedAt)} as maintained by the triggers
+    created in database.py. Returns None if the table_versions table is missing.
+    """
+    conn = get_db_connection()
+    try:
+        placeholders = ', '.join('?' for _ in tables)
+        rows = conn.execute(
+            f"SELECT tableName, version, updatedAt FROM table_versions WHERE tableName IN ({placeholders})",
+            tuple(tables)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    return {row['tableName']: (row['version'], row['updatedAt']) for row in rows}
+
+def conditional_get(*tables):
+    """
+    Answer 304 Not Modified before running the view when the client's
+    If-None-Match / If-Modified-Since match the current version of `tables`.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            versions = get_table_versions(tables)
+            if not versions or len(versions) != len(tables):
+                return f(*args, **kwargs)
+
+            etag = '-'.join(f"{table}.{versions[table][0]}" for table in tables)
+            last_modified = max(
+                datetime.strptime(versions[table][1], '%Y-%m-%dT%H:%M:%SZ')
+                for table in tables
+            )
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since:
+                not_modified = last_modified <= request.if_modified_since.replace(tzinfo=None)
+            else:
+                not_modified = False
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated
+    return decorator
+
 # api_get_products
 @api_bp.route('/api/products', methods=['GET'])
 @token_required  # <-- Requires a valid token
+@conditional_get('products')
 def api_get_products():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -143,6 +168,7 @@ def api_get_products():
 
 @api_bp.route('/api/orders', methods=['GET'])
 @token_required  # <-- Requires a valid token
+@conditional_get('orders')
 def api_get_orders():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -153,6 +179,7 @@ def api_get_orders():
 
 @api_bp.route('/api/users', methods=['GET'])
 @token_required  # <-- Requires a valid token
+@conditional_get('users')
 def api_get_users():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -163,6 +190,7 @@ def api_get_users():
 
 @api_bp.route('/api/categories', methods=['GET'])
 @token_required  # <-- Requires a valid token
+@conditional_get('categories')
 def api_get_categories():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -171,60 +199,227 @@ def api_get_categories():
     conn.close()
     return jsonify(categories)
 
-# DELETE endpoints
-@api_bp.route('/api/deleteOrder/<int:orderId>', methods=['DELETE'])
+# Products by time-decayed popularity (views and add-to-cart, see popularity.py)
+POPULAR_DEFAULT_LIMIT = 50
+POPULAR_MAX_LIMIT = 500
+
+@api_bp.route('/api/products/popular', methods=['GET'])
 @token_required  # <-- Requires a valid token
-def api_delete_order(orderId):
+@conditional_get('products', 'product_stats')
+def api_get_popular_products():
+    limit = request.args.get('limit', POPULAR_DEFAULT_LIMIT, type=int)
+    limit = min(max(limit, 1), POPULAR_MAX_LIMIT)
+    conn = get_db_connection()
+    products = [dict(row) for row in top_products(conn.cursor(), limit)]
+    conn.close()
+    return jsonify(products)
+
+# Content-based neighbours, precomputed by similar.py
+SIMILAR_DEFAULT_LIMIT = 10
+
+@api_bp.route('/api/products/<int:product_id>/similar', methods=['GET'])
+@token_required  # <-- Requires a valid token
+@conditional_get('products', 'similar_products')
+def api_get_similar_products(product_id):
+    limit = request.args.get('limit', SIMILAR_DEFAULT_LIMIT, type=int)
+    limit = min(max(limit, 1), similar.TOP_K)
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("DELETE FROM orders WHERE orderId = ?", (orderId,))
-    conn.commit()
+    cur.execute("SELECT 1 FROM products WHERE productId = ?", (product_id,))
+    if cur.fetchone() is None:
+        conn.close()
+        return jsonify({"error": "Product not found"}), 404
+    cur.execute("""
+        SELECT products.*, sp.score AS similarity
+          FROM similar_products sp
+          JOIN products ON products.productId = sp.otherId
+         WHERE sp.productId = ?
+         ORDER BY sp.rank
+         LIMIT ?
+    """, (product_id, limit))
+    products = [dict(row) for row in cur.fetchall()]
     conn.close()
-    return jsonify({'success': True, 'deleted_id': orderId})
+    return jsonify(products)
 
-@api_bp.route('/api/deleteUser/<int:userId>', methods=['DELETE'])
+# Product gallery (images and videos); files are served by /media/<mediaId>
+@api_bp.route('/api/products/<int:product_id>/media', methods=['GET'])
 @token_required  # <-- Requires a valid token
-def api_delete_user(userId):
+@conditional_get('products', 'product_media')
+def api_get_product_media(product_id):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE userId = ?", (userId,))
-    conn.commit()
+    cur.execute("SELECT 1 FROM products WHERE productId = ?", (product_id,))
+    if cur.fetchone() is None:
+        conn.close()
+        return jsonify({"error": "Product not found"}), 404
+    gallery = media.for_product(cur, product_id)
     conn.close()
-    return jsonify({'success': True, 'deleted_id': userId})
+    return jsonify(gallery)
 
-@api_bp.route('/api/deleteProduct/<int:product_id>', methods=['DELETE'])
+# Change feed: incremental sync for products, orders and order_items
+CHANGE_FEED_TABLES = {
+    'products': 'productId',
+    'orders': 'orderId',
+    'order_items': 'id',
+}
+CHANGE_FEED_MAX_LIMIT = 5000
+
+def fetch_rows_by_id(cur, table, ids, chunk_size=500):
+    """
+    Fetch current rows of a change-feed table by primary key, in chunks
+    to stay under SQLite's bound-parameter limit.
+    """
+    pk = CHANGE_FEED_TABLES[table]
+    ids = list(ids)
+    rows = {}
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        placeholders = ', '.join('?' for _ in chunk)
+        cur.execute(f"SELECT * FROM {table} WHERE {pk} IN ({placeholders})", chunk)
+        for row in cur.fetchall():
+            rows[row[pk]] = dict(row)
+    return rows
+
+@api_bp.route('/api/changes', methods=['GET'])
 @token_required  # <-- Requires a valid token
-def delete_product(product_id):
+def api_get_changes():
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), CHANGE_FEED_MAX_LIMIT)
+
     conn = get_db_connection()
     cur = conn.cursor()
-    # Check if product exists
-    cur.execute("SELECT productId FROM products WHERE productId = ?", (product_id,))
-    if not cur.fetchone():
+
+    cur.execute("SELECT purgedSeq FROM change_log_compaction WHERE id = 1")
+    row = cur.fetchone()
+    purged_seq = row['purgedSeq'] if row else 0
+    if since < purged_seq:
+        cur.execute("SELECT COALESCE(MAX(seq), ?) FROM change_log", (purged_seq,))
+        latest_seq = cur.fetchone()[0]
         conn.close()
-        return jsonify({'success': False, 'error': 'Product not found'}), 404
-    # Delete product
-    cur.execute("DELETE FROM products WHERE productId = ?", (product_id,))
-    conn.commit()
+        return jsonify({
+            'error': 'Cursor expired, full resync required',
+            'purgedSeq': purged_seq,
+            'latestSeq': latest_seq
+        }), 410
+
+    cur.execute("""
+        SELECT seq, tableName, rowId, op, changedAt
+          FROM change_log
+         WHERE seq > ?
+         ORDER BY seq
+         LIMIT ?
+    """, (since, limit))
+    entries = cur.fetchall()
+
+    # Current state of inserted/updated rows, one batched query per table
+    wanted = {}
+    for entry in entries:
+        if entry['op'] != 'delete':
+            wanted.setdefault(entry['tableName'], set()).add(entry['rowId'])
+    current = {table: fetch_rows_by_id(cur, table, ids) for table, ids in wanted.items()}
     conn.close()
+
+    changes = []
+    for entry in entries:
+        data = None
+        if entry['op'] != 'delete':
+            data = current[entry['tableName']].get(entry['rowId'])
+        changes.append({
+            'seq': entry['seq'],
+            'table': entry['tableName'],
+            'id': entry['rowId'],
+            'op': entry['op'],
+            'changedAt': entry['changedAt'],
+            'data': data
+        })
+
+    return jsonify({
+        'changes': changes,
+        'next': entries[-1]['seq'] if entries else since,
+        'hasMore': len(entries) == limit
+    })
+
+@api_bp.route('/api/changes/compact', methods=['POST'])
+@token_required  # <-- Requires a valid token
+@admin_required
+def api_compact_changes():
+    # Also runs by itself every CHANGE_LOG_COMPACT_SECONDS (see change_log.py)
+    retention_days = request.args.get('retention_days', change_log.CHANGE_LOG_RETENTION_DAYS, type=int)
+    return jsonify({'success': True, **change_log.compact(retention_days)})
+
+# DELETE endpoints
+@api_bp.route('/api/deleteOrder/<int:orderId>', methods=['DELETE'])
+@token_required  # <-- Requires a valid token
+def api_delete_order(orderId):
+    # Order lines are purged in the background (see deletions.py); buyers
+    # only delete their own orders
+    if not deletions.delete('orders', orderId, token_owner()):
+        return jsonify({'success': False, 'error': 'Order not found'}), 404
+    return jsonify({'success': True, 'deleted_id': orderId})
+
+@api_bp.route('/api/deleteUser/<int:userId>', methods=['DELETE'])
+@token_required  # <-- Requires a valid token
+@admin_required
+def api_delete_user(userId):
+    # Cart, reviews, messages, orders and products of the user are purged in the background
+    deletions.delete('users', userId)
+    return jsonify({'success': True, 'deleted_id': userId})
+
+@api_bp.route('/api/deleteProduct/<int:product_id>', methods=['DELETE'])
+@token_required  # <-- Requires a valid token
+def delete_product(product_id):
+    # Delete product now, its cart lines, order lines, reviews and media in
+    # the background; sellers only delete their own products
+    if not deletions.delete('products', product_id, token_owner()):
+        return jsonify({'success': False, 'error': 'Product not found'}), 404
     return jsonify({'success': True, 'deleted_id': product_id})
 
+# Request schemas, compiled into validators at import
+LOGIN_SCHEMA = compile_schema({
+    'email': Field('email', required=True),
+    'password': Field('password', required=True),
+}, allow_unknown=True)
+
+SIGNUP_SCHEMA = compile_schema({
+    'email': Field('email', required=True),
+    'password': Field('password', required=True),
+    'firstName': Field('str', required=True),
+    'lastName': Field('str', required=True),
+}, allow_unknown=True)
+
+PRODUCT_SCHEMA = compile_schema({
+    'name': Field('str', required=True),
+    'price': Field('float', required=True, min_val=0),
+    'description': Field('str', required=True),
+    'stock': Field('int', required=True, min_val=0),
+    'categoryId': Field('int', required=True, min_val=1),
+    'image': Field('str', default='default_product.png'),
+    'maker': Field('int', min_val=1),
+}, allow_unknown=True)
+
+PRODUCT_UPDATE_FIELDS = {
+    'name': Field('str'),
+    'price': Field('float', min_val=0),
+    'description': Field('str'),
+    'stock': Field('int', min_val=0),
+    'categoryId': Field('int', min_val=1),
+    'image': Field('str'),
+}
+PRODUCT_UPDATE_SCHEMA = compile_schema(PRODUCT_UPDATE_FIELDS, allow_unknown=True)
+BATCH_UPDATE_SCHEMA = compile_schema({
+    'productId': Field('int', required=True, min_val=1),
+    **PRODUCT_UPDATE_FIELDS
+})
+
 # LOGIN API - Now using secure bcrypt password verification with input validation
 @api_bp.route('/api/login', methods=['POST'])
 def api_login():
-    data = request.get_json()
-    email = data.get('email')
-    password = data.get('password')
-    
-    if not email or not password:
-        return jsonify({'success': False, 'error': 'Email and password required'}), 400
-
-    # Validate email format
-    if not validate_email(email):
-        return jsonify({'success': False, 'error': 'Invalid email format'}), 400
+    data, errors = LOGIN_SCHEMA(request.get_json(silent=True))
+    if errors:
+        return jsonify({'success': False, **validation_error(errors)}), 400
+    email = data['email']
+    password = data['password']
 
-    # Sanitize inputs (additional protection)
-    email = sanitize_input(email)
-    
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute('SELECT userId, email, password, type FROM users WHERE email = ?', (email,))
@@ -246,25 +441,14 @@ def api_login():
 # SIGNUP API - Now using secure bcrypt password hashing with input validation
 @api_bp.route('/api/signup', methods=['POST'])
 def api_signup():
-    data = request.get_json()
-    required_fields = ['email', 'password', 'firstName', 'lastName']
-    for field in required_fields:
-        if not data.get(field):
-            return jsonify({'success': False, 'error': f'Missing field: {field}'}), 400
+    data, errors = SIGNUP_SCHEMA(request.get_json(silent=True))
+    if errors:
+        return jsonify({'success': False, **validation_error(errors)}), 400
 
     email = data['email']
     firstName = data['firstName']
     lastName = data['lastName']
-    
-    # Validate email format
-    if not validate_email(email):
-        return jsonify({'success': False, 'error': 'Invalid email format'}), 400
-    
-    # Sanitize inputs (additional protection)
-    email = sanitize_input(email)
-    firstName = sanitize_input(firstName)
-    lastName = sanitize_input(lastName)
-    
+
     # Hash password with bcrypt for security
     password = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     user_type = 'admin'
@@ -334,29 +518,12 @@ def api_add_product():
     if not request.is_json:
         return jsonify({"error": "Request must be JSON"}), 400
 
-    data = request.get_json()
-
-    required_fields = ['name', 'price', 'description', 'stock', 'categoryId']
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Missing required field: {field}"}), 400
-
-    # Validate numeric inputs
-    if not validate_numeric_input(data['price'], min_val=0):
-        return jsonify({"error": "Invalid price value"}), 400
-    
-    if not validate_numeric_input(data['stock'], min_val=0):
-        return jsonify({"error": "Invalid stock value"}), 400
-    
-    if not validate_numeric_input(data['categoryId'], min_val=1):
-        return jsonify({"error": "Invalid category ID"}), 400
+    # Validated, converted and sanitized in one pass
+    data, errors = PRODUCT_SCHEMA(request.get_json())
+    if errors:
+        return jsonify(validation_error(errors)), 400
 
     try:
-        # Sanitize string inputs
-        name = sanitize_input(data['name'])
-        description = sanitize_input(data['description'])
-        image_url = sanitize_input(data.get('image', 'default_product.png'))
-
         conn = get_db_connection()
         cursor = conn.cursor()
 
@@ -366,8 +533,8 @@ def api_add_product():
         cursor.execute('''INSERT INTO products 
                          (name, price, description, image, stock, categoryId, maker)
                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                     (name, data['price'], description,
-                      image_url, data['stock'], data['categoryId'], maker_id))
+                     (data['name'], data['price'], data['description'],
+                      data['image'], data['stock'], data['categoryId'], maker_id))
 
         product_id = cursor.lastrowid
         conn.commit()
@@ -381,6 +548,185 @@ def api_add_product():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Bulk Product Import API (CSV or NDJSON streamed body)
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ERRORS = 1000
+# Bytes read from the request body at a time (its own readline reads byte by byte)
+IMPORT_READ_SIZE = 1 << 16
+IMPORT_INSERT_SQL = '''INSERT INTO products
+                         (name, price, description, image, stock, categoryId, maker)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+def read_import_lines(stream):
+    """
+    Raw lines of the body, read in IMPORT_READ_SIZE chunks.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(IMPORT_READ_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+def decode_import_lines(stream, bad_lines):
+    """
+    Decode the body line by line; lines that are not valid UTF-8 are decoded
+    with replacement characters and their numbers added to `bad_lines`.
+    """
+    for line_number, raw in enumerate(read_import_lines(stream), start=1):
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.add(line_number)
+            yield raw.decode('utf-8', errors='replace')
+
+def iter_import_rows(stream, fmt):
+    """
+    Yield (line_number, row_dict_or_None, error) from a CSV or NDJSON body
+    without loading it all in memory.
+    """
+    bad_lines = set()
+    lines = decode_import_lines(stream, bad_lines)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        first_line = 1
+        for row in reader:
+            # A quoted field may span lines: check every line of the record
+            if bad_lines.intersection(range(first_line, reader.line_num + 1)):
+                yield reader.line_num, None, 'Invalid UTF-8'
+            else:
+                yield reader.line_num, row, None
+            first_line = reader.line_num + 1
+        return
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if line_number in bad_lines:
+            yield line_number, None, 'Invalid UTF-8'
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Row must be a JSON object'
+            continue
+        yield line_number, row, None
+
+def validate_import_row(row, category_ids, default_maker, allow_maker=True):
+    """
+    Validate one imported product and return (params_tuple, None) or (None, error).
+    Without allow_maker, rows may not name a seller other than default_maker.
+    """
+    data, errors = PRODUCT_SCHEMA(row)
+    if errors:
+        return None, '; '.join(e['error'] for e in errors)
+    if data['categoryId'] not in category_ids:
+        return None, "Invalid categoryId value"
+    if not data['name']:
+        return None, "Invalid name value"
+    maker = data.get('maker', default_maker)
+    if not allow_maker and maker != default_maker:
+        return None, "Only admins can import products for another seller"
+    return (data['name'], data['price'], data['description'], data['image'],
+            data['stock'], data['categoryId'], maker), None
+
+class ImportErrors:
+    """
+    Failed rows of an import: all are counted, the first IMPORT_MAX_ERRORS kept.
+    """
+
+    def __init__(self, limit=IMPORT_MAX_ERRORS):
+        self.limit = limit
+        self.count = 0
+        self.rows = []
+
+    def add(self, line_number, error):
+        self.count += 1
+        if len(self.rows) < self.limit:
+            self.rows.append({'row': line_number, 'error': error})
+
+def insert_import_chunk(conn, chunk, errors):
+    """
+    Insert a chunk of validated rows in one transaction. If the batch fails,
+    retry row by row so only the offending rows are reported.
+    """
+    try:
+        with conn:
+            conn.executemany(IMPORT_INSERT_SQL, [params for _, params in chunk])
+        return len(chunk)
+    except sqlite3.Error:
+        pass
+    inserted = 0
+    for line_number, params in chunk:
+        try:
+            with conn:
+                conn.execute(IMPORT_INSERT_SQL, params)
+            inserted += 1
+        except sqlite3.Error as e:
+            errors.add(line_number, str(e))
+    return inserted
+
+@api_bp.route('/api/importProducts', methods=['POST'])
+@token_required  # <-- Requires a valid token
+def api_import_products():
+    fmt = request.args.get('format')
+    if not fmt:
+        content_type = (request.mimetype or '').lower()
+        fmt = 'csv' if content_type in ('text/csv', 'application/csv') else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"error": "Unsupported format, use csv or ndjson"}), 400
+
+    # Sellers import their own products; only admins choose the seller
+    payload = g.jwt_payload
+    is_admin = payload.get('type') == 'admin'
+    if is_admin:
+        default_maker = request.args.get('maker', 1, type=int)
+    else:
+        default_maker = payload.get('user_id')
+        if request.args.get('maker', default_maker, type=int) != default_maker:
+            return jsonify({'error': 'Admin privileges required to import for another seller'}), 403
+
+    inserted = 0
+    total = 0
+    errors = ImportErrors()
+    chunk = []
+    conn = get_db_connection()
+    try:
+        category_ids = {row[0] for row in conn.execute("SELECT categoryId FROM categories")}
+        for line_number, row, error in iter_import_rows(request.stream, fmt):
+            total += 1
+            if error is None:
+                params, error = validate_import_row(row, category_ids, default_maker, allow_maker=is_admin)
+            if error is not None:
+                errors.add(line_number, error)
+                continue
+            chunk.append((line_number, params))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                inserted += insert_import_chunk(conn, chunk, errors)
+                chunk = []
+        if chunk:
+            inserted += insert_import_chunk(conn, chunk, errors)
+    finally:
+        conn.close()
+
+    errors.rows.sort(key=lambda e: e['row'])
+    return jsonify({
+        'success': not errors.count,
+        'total': total,
+        'inserted': inserted,
+        'failed': errors.count,
+        'errors': errors.rows,
+        'errorsTruncated': errors.count > len(errors.rows)
+    }), 200
+
 # Edit Product API with secure dynamic query building
 @api_bp.route('/api/editProduct/<int:productId>', methods=['PUT'])
 @token_required  # <-- Requires a valid token
@@ -388,7 +734,12 @@ def api_edit_product(productId):
     if not request.is_json:
         return jsonify({"error": "Request must be JSON"}), 400
 
-    data = request.get_json()
+    # Only whitelisted fields (PRODUCT_UPDATE_FIELDS) are kept, already validated
+    changes, errors = PRODUCT_UPDATE_SCHEMA(request.get_json())
+    if errors:
+        return jsonify(validation_error(errors)), 400
+    if not changes:
+        return jsonify({"error": "No valid fields to update"}), 400
 
     try:
         conn = get_db_connection()
@@ -401,34 +752,9 @@ def api_edit_product(productId):
             conn.close()
             return jsonify({"error": "Product not found"}), 404
 
-        # Define allowed fields for security
-        allowed_fields = {'name', 'price', 'description', 'stock', 'categoryId', 'image'}
-        update_fields = []
-        update_values = []
-
-        for field, value in data.items():
-            if field in allowed_fields and value is not None:
-                # Validate field name for security
-                if not validate_field_name(field):
-                    conn.close()
-                    return jsonify({"error": f"Invalid field name: {field}"}), 400
-                
-                # Validate numeric fields
-                if field in ['price', 'stock', 'categoryId']:
-                    if not validate_numeric_input(value, min_val=0):
-                        conn.close()
-                        return jsonify({"error": f"Invalid {field} value"}), 400
-                
-                # Sanitize string fields
-                if field in ['name', 'description', 'image']:
-                    value = sanitize_input(str(value))
-                
-                update_fields.append(f"{field} = ?")
-                update_values.append(value)
-
-        if not update_fields:
-            conn.close()
-            return jsonify({"error": "No valid fields to update"}), 400
+        fields = [field for field in changes if validate_field_name(field)]
+        update_fields = [f"{field} = ?" for field in fields]
+        update_values = [changes[field] for field in fields]
 
         # Build secure query with validated field names
         update_query = f"UPDATE products SET {', '.join(update_fields)} WHERE productId = ?"
@@ -455,5 +781,238 @@ def api_edit_product(productId):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Orders Export API (streamed CSV / NDJSON, constant memory)
+EXPORT_BATCH_SIZE = 2000
+EXPORT_COLUMNS = (
+    'orderId', 'orderDate', 'userId', 'total', 'itemId', 'productId',
+    'productName', 'price', 'quantity', 'sellerId'
+)
+
+def parse_export_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        return False
+
+@api_bp.route('/api/export/orders', methods=['GET'])
+@token_required  # <-- Requires a valid token
+@admin_required
+def api_export_orders():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"error": "Unsupported format, use csv or ndjson"}), 400
+
+    # `from` is inclusive, `to` is exclusive (ISO 8601 dates or datetimes)
+    date_from = parse_export_date(request.args.get('from'))
+    date_to = parse_export_date(request.args.get('to'))
+    if date_from is False or date_to is False:
+        return jsonify({"error": "Invalid date, use ISO 8601 (YYYY-MM-DD)"}), 400
+    seller_id = request.args.get('sellerId', type=int)
+
+    where_clauses = []
+    params = []
+    if date_from:
+        where_clauses.append("o.orderDate >= ?")
+        params.append(date_from)
+    if date_to:
+        where_clauses.append("o.orderDate < ?")
+        params.append(date_to)
+    # With a seller, only orders containing their lines, and only those lines
+    join = "LEFT JOIN"
+    if seller_id is not None:
+        join = "JOIN"
+        where_clauses.append("p.maker = ?")
+        params.append(seller_id)
+    where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+
+    # price is the unit price paid, stored on the order line
+    query = f"""
+        SELECT o.orderId, o.orderDate, o.userId, o.total,
+               oi.id AS itemId, oi.productId, p.name AS productName,
+               oi.price, oi.quantity, p.maker AS sellerId
+          FROM orders o
+          {join} order_items oi ON oi.orderId = o.orderId
+          {join} products p     ON p.productId = oi.productId
+          {where_sql}
+         ORDER BY o.orderId, oi.id
+    """
+
+    def generate():
+        conn = connect_db()
+        try:
+            cur = conn.execute(query, params)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == 'csv':
+                writer.writerow(EXPORT_COLUMNS)
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+            if buffer.tell():
+                yield buffer.getvalue()
+        finally:
+            conn.close()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=orders.{fmt}'
+    return response
+
+# Batch Product Update / Delete API
+BATCH_MAX_ITEMS = 10000
+BATCH_EDITABLE_FIELDS = tuple(PRODUCT_UPDATE_FIELDS)
+
+def wants_returned_rows():
+    return request.args.get('returnRows', '').lower() in ('1', 'true')
+
+def product_makers(cur, ids, chunk_size=500):
+    ids = list(ids)
+    makers = {}
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        placeholders = ', '.join('?' for _ in chunk)
+        cur.execute(f"SELECT productId, maker FROM products WHERE productId IN ({placeholders})", chunk)
+        makers.update((row[0], row[1]) for row in cur.fetchall())
+    return makers
+
+def split_owned(makers, owner):
+    """
+    (ids the token may change, ids of other sellers' products); everything
+    is allowed when owner is None (admin token).
+    """
+    if owner is None:
+        return set(makers), set()
+    owned = {pid for pid, maker in makers.items() if maker == owner}
+    return owned, set(makers) - owned
+
+def validate_batch_update(item):
+    """
+    Validate one batch update item and return (productId, {field: value}, errors).
+    """
+    changes, errors = BATCH_UPDATE_SCHEMA(item)
+    if errors:
+        return None, None, errors
+    product_id = changes.pop('productId')
+    if not changes:
+        return None, None, [{'field': None, 'error': "No valid fields to update"}]
+    return product_id, changes, None
+
+@api_bp.route('/api/products', methods=['PATCH'])
+@token_required  # <-- Requires a valid token
+def api_batch_edit_products():
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Request body must be a non-empty JSON array"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items (max {BATCH_MAX_ITEMS})"}), 413
+
+    errors = []
+    updates = {}
+    for index, item in enumerate(items):
+        product_id, changes, item_errors = validate_batch_update(item)
+        if item_errors:
+            errors.extend({'index': index, **error} for error in item_errors)
+        else:
+            # A later item for the same product overrides earlier fields
+            updates.setdefault(product_id, {}).update(changes)
+    if errors:
+        return jsonify({"error": "Validation failed", "errors": errors}), 400
+
+    # Sellers only edit their own products
+    owner = token_owner()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    makers = product_makers(cur, updates)
+    found, forbidden = split_owned(makers, owner)
+    not_found = sorted(set(updates) - set(makers))
+
+    # Group products by the set of fields they change: one executemany per group
+    groups = {}
+    for product_id in found:
+        changes = updates[product_id]
+        fields = tuple(field for field in BATCH_EDITABLE_FIELDS if field in changes)
+        groups.setdefault(fields, []).append(
+            tuple(changes[field] for field in fields) + (product_id,)
+        )
+
+    where = "productId = ?"
+    if owner is not None:
+        where += " AND maker = ?"
+        groups = {fields: [row + (owner,) for row in rows] for fields, rows in groups.items()}
+    try:
+        with conn:
+            for fields, rows in groups.items():
+                assignments = ', '.join(f"{field} = ?" for field in fields)
+                conn.executemany(f"UPDATE products SET {assignments} WHERE {where}", rows)
+    except sqlite3.Error as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 500
+
+    response = {
+        "success": True,
+        "updated": len(found),
+        "notFound": not_found,
+        "forbidden": sorted(forbidden)
+    }
+    if wants_returned_rows():
+        rows = fetch_rows_by_id(cur, 'products', sorted(found))
+        response["products"] = [rows[pid] for pid in sorted(rows)]
+    conn.close()
+
+    return jsonify(response), 200
+
+@api_bp.route('/api/products', methods=['DELETE'])
+@token_required  # <-- Requires a valid token
+def api_batch_delete_products():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"error": "Request body must contain a non-empty 'ids' array"}), 400
+    if len(ids) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many items (max {BATCH_MAX_ITEMS})"}), 413
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({"error": "ids must be integers"}), 400
+
+    # Sellers only delete their own products
+    ids = set(ids)
+    owner = token_owner()
+    deleted_rows = None
+    conn = get_db_connection()
+    try:
+        _, forbidden = split_owned(product_makers(conn.cursor(), ids), owner)
+        if wants_returned_rows():
+            deleted_rows = fetch_rows_by_id(conn.cursor(), 'products', ids)
+    finally:
+        conn.close()
+
+    try:
+        found = deletions.delete_many('products', ids, owner)
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
+    if deleted_rows is not None:
+        deleted_rows = {pid: row for pid, row in deleted_rows.items() if pid in found}
+
+    response = {
+        "success": True,
+        "deleted": sorted(found),
+        "notFound": sorted(ids - found - forbidden),
+        "forbidden": sorted(forbidden - found)
+    }
+    if deleted_rows is not None:
+        response["products"] = [deleted_rows[pid] for pid in sorted(deleted_rows)]
+    return jsonify(response), 200
+
 # REMOVED: Invalid main block for Blueprint
 # Blueprints don't have app.run() - that belongs in your main app file
\ No newline at end of file
@@ -0,0 +1,11 @@
+from flask import session
+
+# Session checks shared by the admin tools (query and request profilers,
+# deletion progress, metrics). Pages of main.py keep their own redirects.
+
+
+def is_admin_session():
+    """
+    True when the session belongs to an admin (admin login or user type).
+    """
+    return bool(session.get('admin')) or session.get('user_type') == 'admin'
@@ -0,0 +1,276 @@
+"""
+Route-level benchmark of the Flask app.
+
+Drives the real app (main.create_app()) through the Flask test client
+against a generated dataset (see generate_data.py) and reports p50/p95/p99 latency,
+throughput and SQL statements per request for each scenario. Results are
+written as JSON so two commits can be compared:
+
+    python benchmarks/bench_routes.py --output before.json
+    python benchmarks/bench_routes.py --output after.json --compare before.json
+
+The database is copied into a temporary working directory, so write
+scenarios (checkout, send_message) never modify the source database.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+SEARCH_TERMS = ['chaise', 'lampe', 'montre', 'sac', 'noir', 'premium', 'sport', 'table', 'xyz', '']
+SORTINGS = [None, 'price_asc', 'price_desc', 'stock_asc', 'stock_desc', 'popular']
+
+
+class QueryCounter:
+    """
+    Counts SQL statements executed through db.connect_db.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self):
+        import db
+        db.add_statement_listener(self._on_statement)
+
+    def uninstall(self):
+        import db
+        db.statement_listeners.remove(self._on_statement)
+
+    def _on_statement(self, sql, seconds, cursor):
+        if sql is not None:
+            self.count += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def prepare_workdir(args):
+    workdir = tempfile.mkdtemp(prefix='directshop-bench-')
+    target = os.path.join(workdir, 'database.db')
+    if args.db:
+        shutil.copyfile(args.db, target)
+    else:
+        import generate_data
+        generate_data.main([
+            '--output', target, '--seed', str(args.seed),
+            '--buyers', '2000', '--sellers', '200', '--products', str(args.products),
+            '--carts', '1000', '--orders', str(args.orders), '--reviews', '20000',
+            '--messages', '50000',
+        ])
+    return workdir
+
+
+def dataset_info(db_path):
+    conn = sqlite3.connect(db_path)
+    info = {
+        'buyer': conn.execute("""
+            SELECT u.email, u.userId FROM users u JOIN kart k ON k.userId = u.userId
+             WHERE u.type = 'acheteur' GROUP BY u.userId ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone(),
+        'product_ids': [r[0] for r in conn.execute("SELECT productId FROM products")],
+        'category_ids': [r[0] for r in conn.execute("SELECT categoryId FROM categories")],
+        'conversation': conn.execute("""
+            SELECT sender, receiver FROM messages
+             GROUP BY sender, receiver ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone(),
+        'counts': {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('users', 'products', 'orders', 'order_items', 'kart', 'avis', 'messages')
+        },
+    }
+    if info['buyer'] is None:
+        info['buyer'] = conn.execute("SELECT email, userId FROM users WHERE type = 'acheteur' LIMIT 1").fetchone()
+    conn.close()
+    return info
+
+
+def build_scenarios(info, rng):
+    """
+    Each scenario is (name, login, request_factory, before). request_factory
+    returns (method, url, kwargs); before runs untimed ahead of each request.
+    """
+    import api
+    token = api.generate_access_token(1, 'bench@example.com', 'admin')
+    auth = {'headers': {'Authorization': f'Bearer {token}'}}
+    buyer_email, buyer_id = info['buyer']
+    products = info['product_ids']
+    categories = info['category_ids']
+    sender, receiver = info['conversation'] or (buyer_email, buyer_email)
+
+    def refill_cart():
+        conn = sqlite3.connect('database.db')
+        conn.executemany("INSERT INTO kart (userId, productId) VALUES (?, ?)",
+                         [(buyer_id, rng.choice(products)) for _ in range(3)])
+        conn.commit()
+        conn.close()
+
+    def root_url():
+        sorting = rng.choice(SORTINGS)
+        params = []
+        term = rng.choice(SEARCH_TERMS)
+        if term:
+            params.append(f'query={term}')
+        if rng.random() < 0.5:
+            params.append(f'category_id={rng.choice(categories)}')
+        path = f'/{sorting}' if sorting else '/'
+        return path + ('?' + '&'.join(params) if params else '')
+
+    return [
+        ('root', None, lambda: ('GET', root_url(), {}), None),
+        ('root_ajax', None, lambda: ('GET', root_url(), {'headers': {'X-Requested-With': 'XMLHttpRequest'}}), None),
+        ('productDescription', buyer_email,
+         lambda: ('GET', f'/productDescription?productId={rng.choice(products)}', {}), None),
+        ('cart', buyer_email, lambda: ('GET', '/cart', {}), None),
+        ('checkout_get', buyer_email, lambda: ('GET', '/checkout', {}), None),
+        ('checkout_post', buyer_email, lambda: ('POST', '/checkout', {'json': {}}), refill_cart),
+        ('get_messages', sender, lambda: ('GET', f'/get_messages?user_email={receiver}', {}), None),
+        ('send_message', sender,
+         lambda: ('POST', '/send_message', {'json': {'receiver': receiver, 'content': 'Bonjour, toujours disponible ?'}}),
+         None),
+        ('api_products', None, lambda: ('GET', '/api/products', auth), None),
+        ('api_categories', None, lambda: ('GET', '/api/categories', auth), None),
+        ('api_orders', None, lambda: ('GET', '/api/orders', auth), None),
+        ('api_users', None, lambda: ('GET', '/api/users', auth), None),
+        ('api_changes', None, lambda: ('GET', '/api/changes?since=0&limit=500', auth), None),
+    ]
+
+
+def run_scenario(app, counter, scenario, iterations, warmup):
+    name, login, request_factory, before = scenario
+    client = app.test_client()
+    if login:
+        with client.session_transaction() as sess:
+            sess['email'] = login
+
+    latencies = []
+    queries = 0
+    statuses = {}
+    for i in range(warmup + iterations):
+        if before:
+            before()
+        method, url, kwargs = request_factory()
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries += counter.count
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'iterations': iterations,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'throughput_rps': iterations / total if total else 0.0,
+        'queries_per_request': queries / iterations,
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = f"{'scenario':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9} {'queries':>8}"
+    if baseline:
+        header += f" {'Δp50':>8}"
+    print(header)
+    for name, r in results.items():
+        line = (f"{name:<20} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} "
+                f"{r['throughput_rps']:9.1f} {r['queries_per_request']:8.1f}")
+        before = (baseline or {}).get(name)
+        if before and before['p50_ms']:
+            line += f" {(r['p50_ms'] / before['p50_ms'] - 1) * 100:+7.1f}%"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DirectShop routes.")
+    parser.add_argument('--db', help="existing database to copy (default: generate one)")
+    parser.add_argument('--products', type=int, default=20000, help="products in the generated dataset")
+    parser.add_argument('--orders', type=int, default=50000, help="orders in the generated dataset")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', help="comma-separated scenario names")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    workdir = prepare_workdir(args)
+    previous_cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    compare = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(workdir)
+    counter = QueryCounter()
+    try:
+        counter.install()
+        from main import create_app
+        # The scenarios replay many requests from one client: no rate limiting
+        app = create_app({'TESTING': True, 'RATE_LIMIT_ENABLED': False})
+        info = dataset_info('database.db')
+        rng = random.Random(args.seed)
+        scenarios = build_scenarios(info, rng)
+        if args.only:
+            wanted = set(args.only.split(','))
+            scenarios = [s for s in scenarios if s[0] in wanted]
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario[0]] = run_scenario(app, counter, scenario, args.iterations, args.warmup)
+    finally:
+        counter.uninstall()
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'dataset': info['counts'],
+        },
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if compare:
+        with open(compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    print(f"results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Start-up benchmark of the Flask app.
+
+Each run is a fresh interpreter (nothing cached in sys.modules) that times
+`import main` (which also configures the app, see create_app()) and the
+first request to `/`, and reports its peak RSS. A pre-fork run also imports
+and configures the app once, forks, and times the first request served by
+the child, which is what a worker started by a preloading server pays. Run
+from the repository root against an existing database (copied to a
+temporary directory):
+
+    python benchmarks/bench_startup.py --db database.db [--runs 10] [--importtime]
+
+--importtime prints the slowest modules of one import (python -X importtime).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, os, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+started = time.perf_counter()
+import main
+app = main.create_app({'TESTING': True})
+imported = time.perf_counter()
+status = app.test_client().get('/').status_code
+served = time.perf_counter()
+
+read_end, write_end = os.pipe()
+pid = os.fork()
+if pid == 0:
+    forked = time.perf_counter()
+    child_status = app.test_client().get('/').status_code
+    os.write(write_end, json.dumps([time.perf_counter() - forked, child_status]).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+fork_first, child_status = json.loads(os.read(read_end, 1000))
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'fork_first_request_ms': fork_first * 1000,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'status': [status, child_status],
+}))
+'''
+
+METRICS = ('import_ms', 'first_request_ms', 'fork_first_request_ms', 'rss_mb')
+
+
+def run_probe(workdir):
+    result = subprocess.run([sys.executable, '-c', PROBE, BASE_DIR], cwd=workdir,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(workdir, top):
+    code = f'import sys; sys.path.insert(0, {BASE_DIR!r}); import main'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=workdir, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        # "import time: <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='database.db', help="database to start against")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true', help="list the slowest imports")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', help="write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='directshop-startup-')
+    try:
+        shutil.copyfile(args.db, os.path.join(workdir, 'database.db'))
+        runs = [run_probe(workdir) for _ in range(args.runs)]
+        imports = slowest_imports(workdir, args.top) if args.importtime else []
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {}
+    print(f"{'metric':<24}{'median':>10}{'min':>10}{'max':>10}")
+    for metric in METRICS:
+        values = [run[metric] for run in runs]
+        summary[metric] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+        print(f"{metric:<24}{summary[metric]['median']:>10.1f}{min(values):>10.1f}{max(values):>10.1f}")
+    if imports:
+        print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+        for cumulative_us, self_us, name in imports:
+            print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'runs': args.runs, 'results': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
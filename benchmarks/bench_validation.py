@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of per-request validation cost for the JSON API.
+
+Compares the former field-by-field path (14 uncompiled re.sub passes per
+string plus separate numeric/email checks) with the compiled schemas used
+by api.py. Run from the repository root:
+
+    python benchmarks/bench_validation.py [iterations]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import PRODUCT_SCHEMA, SIGNUP_SCHEMA  # noqa: E402
+
+
+LEGACY_PATTERNS = [
+    r"[';\"\\]", r"--", r"/\*.*?\*/",
+    r"\bUNION\b", r"\bSELECT\b", r"\bINSERT\b", r"\bUPDATE\b",
+    r"\bDELETE\b", r"\bDROP\b", r"\bCREATE\b", r"\bALTER\b",
+    r"\bEXEC\b", r"\bEXECUTE\b"
+]
+
+
+def legacy_sanitize(value):
+    for pattern in LEGACY_PATTERNS:
+        value = re.sub(pattern, '', value, flags=re.IGNORECASE)
+    return value.strip()
+
+
+def legacy_numeric(value, min_val=None):
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return False
+    return min_val is None or number >= min_val
+
+
+def legacy_product(data):
+    for field in ('name', 'price', 'description', 'stock', 'categoryId'):
+        if field not in data:
+            return None
+    if not (legacy_numeric(data['price'], 0) and legacy_numeric(data['stock'], 0)
+            and legacy_numeric(data['categoryId'], 1)):
+        return None
+    return (legacy_sanitize(data['name']), legacy_sanitize(data['description']),
+            legacy_sanitize(data.get('image', 'default_product.png')))
+
+
+def legacy_signup(data):
+    for field in ('email', 'password', 'firstName', 'lastName'):
+        if not data.get(field):
+            return None
+    if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', data['email']):
+        return None
+    return (legacy_sanitize(data['email']), legacy_sanitize(data['firstName']),
+            legacy_sanitize(data['lastName']))
+
+
+PRODUCT = {
+    'name': 'Chaise de bureau ergonomique',
+    'price': '149.90',
+    'description': 'Chaise réglable en hauteur, accoudoirs 3D, support lombaire.',
+    'stock': 12,
+    'categoryId': 4,
+}
+SIGNUP = {
+    'email': 'client.test@directshop.ma',
+    'password': 'motdepasse',
+    'firstName': 'Yasmine',
+    'lastName': 'El Amrani',
+}
+
+
+def bench(label, func, data, iterations):
+    seconds = min(timeit.repeat(lambda: func(data), number=iterations, repeat=5))
+    print(f"{label:<28} {seconds / iterations * 1e6:8.2f} µs/request")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bench("addProduct  legacy", legacy_product, PRODUCT, iterations)
+    bench("addProduct  compiled", PRODUCT_SCHEMA, PRODUCT, iterations)
+    bench("signup      legacy", legacy_signup, SIGNUP, iterations)
+    bench("signup      compiled", SIGNUP_SCHEMA, SIGNUP, iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+"Frequently bought together" recommendations.
+
+Counts, for every pair of products, the orders containing both (X^T X of
+the sparse order x product incidence matrix), then keeps the TOP_K most frequent
+partners of each product in the bought_together table read by the product
+and cart pages. Runs incrementally: only orders after the last processed
+orderId are counted, and only the products they touch get their top-K
+recomputed.
+
+    python bought_together.py            # new orders since the last run
+    python bought_together.py --full     # recount everything
+
+Counting needs numpy and scipy (pip install numpy scipy); the web pages
+only read the bought_together table.
+"""
+import argparse
+import sys
+import time
+
+import db
+
+TOP_K = 10
+# Orders are read and counted this many at a time (one write transaction each)
+ORDER_CHUNK = 20000
+# Pairs grow quadratically with order size; huge orders carry little signal
+MAX_ITEMS_PER_ORDER = 50
+
+
+def _numeric():
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        sys.exit("bought_together.py needs numpy and scipy to count orders: pip install numpy scipy")
+    return numpy, sparse
+
+
+def count_pairs(rows):
+    """
+    Co-occurrence counts over (orderId, productId) rows: arrays productA,
+    productB, n with productA < productB. A product repeated in an order
+    counts once; only the MAX_ITEMS_PER_ORDER smallest ids of an order count.
+    """
+    numpy, sparse = _numeric()
+    if not rows:
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return empty, empty, empty
+    pairs = numpy.array(rows, dtype=numpy.int64)
+    orders = pairs[:, 0] - pairs[:, 0].min()
+    products = pairs[:, 1]
+    # Incidence matrix, one row per order and one column per product id;
+    # summing duplicates sorts each row's ids, then every entry becomes 1
+    incidence = sparse.csr_matrix(
+        (numpy.ones(len(products), dtype=numpy.int32), (orders, products)),
+        shape=(orders.max() + 1, products.max() + 1))
+    incidence.sum_duplicates()
+    incidence.data[:] = 1
+    sizes = numpy.diff(incidence.indptr)
+    if sizes.max() > MAX_ITEMS_PER_ORDER:
+        position = numpy.arange(incidence.nnz) - numpy.repeat(incidence.indptr[:-1], sizes)
+        incidence.data[position >= MAX_ITEMS_PER_ORDER] = 0
+        incidence.eliminate_zeros()
+    # (i, j) of X^T X = orders containing both products; upper triangle: i < j
+    co = sparse.triu(incidence.T @ incidence, k=1).tocoo()
+    return co.row, co.col, co.data
+
+
+def _apply_counts(cur, counts, last_order_id):
+    cur.executemany('''
+        INSERT INTO co_purchase_counts (productA, productB, n) VALUES (?, ?, ?)
+        ON CONFLICT(productA, productB) DO UPDATE SET n = n + excluded.n
+    ''', zip(*(column.tolist() for column in counts)))
+    cur.execute("UPDATE bought_together_state SET lastOrderId = ? WHERE id = 1", (last_order_id,))
+
+
+TOP_K_SQL = '''
+    INSERT INTO bought_together (productId, rank, otherId, n)
+    SELECT productId, rank, otherId, n FROM (
+        SELECT productId, otherId, n,
+               ROW_NUMBER() OVER (PARTITION BY productId ORDER BY n DESC, otherId) AS rank
+          FROM (SELECT productA AS productId, productB AS otherId, n FROM co_purchase_counts {where_a}
+                UNION ALL
+                SELECT productB, productA, n FROM co_purchase_counts {where_b})
+    )
+     WHERE rank <= ?
+'''
+
+
+def _recompute_top_k(cur, product_ids):
+    placeholders = ', '.join('?' for _ in product_ids)
+    cur.execute(f"DELETE FROM bought_together WHERE productId IN ({placeholders})", product_ids)
+    cur.execute(TOP_K_SQL.format(where_a=f"WHERE productA IN ({placeholders})",
+                                 where_b=f"WHERE productB IN ({placeholders})"),
+                product_ids + product_ids + [TOP_K])
+
+
+def _reset(cur):
+    cur.execute("DELETE FROM co_purchase_counts")
+    cur.execute("DELETE FROM bought_together")
+    cur.execute("UPDATE bought_together_state SET lastOrderId = 0 WHERE id = 1")
+
+
+def update(full=False):
+    """
+    Count the orders placed since the last run (all orders with full=True)
+    and refresh the top-K of the products involved. Returns (orders, products).
+    """
+    if full:
+        db.execute_write(_reset)
+    conn = db.connect_db()
+    try:
+        last_order_id = conn.execute("SELECT lastOrderId FROM bought_together_state WHERE id = 1").fetchone()[0]
+        orders = 0
+        touched = set()
+        while True:
+            order_ids = [row[0] for row in conn.execute(
+                "SELECT orderId FROM orders WHERE orderId > ? ORDER BY orderId LIMIT ?",
+                (last_order_id, ORDER_CHUNK))]
+            if not order_ids:
+                break
+            rows = conn.execute('''
+                SELECT orderId, productId FROM order_items
+                 WHERE orderId > ? AND orderId <= ? AND productId IS NOT NULL
+            ''', (last_order_id, order_ids[-1])).fetchall()
+            counts = count_pairs(rows)
+            last_order_id = order_ids[-1]
+            db.execute_write(_apply_counts, counts, last_order_id)
+            orders += len(order_ids)
+            touched.update(counts[0].tolist())
+            touched.update(counts[1].tolist())
+    finally:
+        conn.close()
+
+    # Small transactions so the site's writers are never held up for long
+    touched = sorted(touched)
+    for start in range(0, len(touched), 400):
+        db.execute_write(_recompute_top_k, touched[start:start + 400])
+    return orders, len(touched)
+
+
+def for_product(cur, product_id, limit=6):
+    """
+    Products most often ordered with product_id: (productId, name, price, image).
+    """
+    cur.execute('''
+        SELECT p.productId, p.name, p.price, p.image
+          FROM bought_together bt
+          JOIN products p ON p.productId = bt.otherId
+         WHERE bt.productId = ?
+         ORDER BY bt.rank
+         LIMIT ?
+    ''', (product_id, limit))
+    return cur.fetchall()
+
+
+def for_cart(cur, product_ids, limit=6):
+    """
+    Products most often ordered with the cart's products, excluding those
+    already in it, scored by the summed co-occurrence counts.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return []
+    placeholders = ', '.join('?' for _ in product_ids)
+    cur.execute(f'''
+        SELECT p.productId, p.name, p.price, p.image
+          FROM bought_together bt
+          JOIN products p ON p.productId = bt.otherId
+         WHERE bt.productId IN ({placeholders})
+           AND bt.otherId NOT IN ({placeholders})
+         GROUP BY bt.otherId
+         ORDER BY SUM(bt.n) DESC, bt.otherId
+         LIMIT ?
+    ''', product_ids + product_ids + [limit])
+    return cur.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update 'frequently bought together' recommendations.")
+    parser.add_argument('--full', action='store_true', help="recount all orders instead of new ones only")
+    parser.add_argument('--db', help="database path (default: database.db)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.DATABASE = args.db
+    started = time.perf_counter()
+    orders, products = update(full=args.full)
+    elapsed = time.perf_counter() - started
+    print(f"{orders} orders counted, top-{TOP_K} refreshed for {products} products in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import db
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU cache. The least recently used entry is evicted
+    once more than `maxsize` entries are stored.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Catalog version: the table_versions rows of the tables the product grid is
+# built from. Their triggers bump them on every write, from any process, so
+# fragments cached by a worker are never served after a write in another one.
+# product_stats (rewritten by every popularity refresh) only orders the
+# 'popular' sort, so only that sort depends on its version.
+CATALOG_TABLES = ('products', 'categories', 'category_attributes',
+                  'product_category_attributes', 'produits_details')
+POPULAR_CATALOG_TABLES = CATALOG_TABLES + ('product_stats',)
+
+
+def catalog_version(sorting=None):
+    """
+    Current versions of the tables the grid sorted by `sorting` is built
+    from, or None when they cannot be read (the page must then not be cached).
+    """
+    tables = POPULAR_CATALOG_TABLES if sorting == 'popular' else CATALOG_TABLES
+    placeholders = ', '.join('?' for _ in tables)
+    conn = db.connect_db()
+    try:
+        rows = conn.execute(
+            f"SELECT tableName, version FROM table_versions WHERE tableName IN ({placeholders})",
+            tables
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    versions = dict(rows)
+    if len(versions) != len(tables):
+        return None
+    return tuple(versions[table] for table in tables)
+
+
+CATALOG_CACHE_SIZE = 512
+
+# Rendered product grid of the home page, keyed by
+# (query, category_id, sorting, catalog_version)
+catalog_fragments = LRUCache(maxsize=CATALOG_CACHE_SIZE)
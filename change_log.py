@@ -0,0 +1,121 @@
+import os
+import time
+
+import db
+
+# Compaction of change_log (the /api/changes feed). Only the latest entry of
+# each row is kept, and entries older than CHANGE_LOG_RETENTION_DAYS are
+# dropped; cursors older than the purged seq must resync. Runs by itself every
+# CHANGE_LOG_COMPACT_SECONDS from the background thread of deletions.py, at
+# most once per period across workers (compactedAt in change_log_compaction).
+# The log is compacted in batches of CHANGE_LOG_BATCH_SIZE entries, one short
+# write transaction each, so other writers get the lock between batches.
+
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', 7))
+CHANGE_LOG_COMPACT_SECONDS = int(os.environ.get('CHANGE_LOG_COMPACT_SECONDS', 3600))
+CHANGE_LOG_BATCH_SIZE = int(os.environ.get('CHANGE_LOG_BATCH_SIZE', 2000))
+# Pause between two batches, leaving the write lock to the site
+CHANGE_LOG_PAUSE_SECONDS = float(os.environ.get('CHANGE_LOG_PAUSE_SECONDS', 0.01))
+
+_next_check = 0.0
+
+
+def _claim(cur, now, interval):
+    # Record the compaction start; with `interval`, only when the previous
+    # one is older than that, so a single worker compacts per period
+    if interval is not None:
+        cur.execute("SELECT compactedAt FROM change_log_compaction WHERE id = 1")
+        row = cur.fetchone()
+        if row and now - row[0] < interval:
+            return False
+    cur.execute("UPDATE change_log_compaction SET compactedAt = ? WHERE id = 1", (now,))
+    return True
+
+
+def _collapse_batch(cur, start, stop):
+    # Entries of [start, stop) superseded by a later entry of the same row
+    cur.execute("""
+        DELETE FROM change_log
+         WHERE seq >= ? AND seq < ?
+           AND EXISTS (SELECT 1 FROM change_log later
+                        WHERE later.tableName = change_log.tableName
+                          AND later.rowId = change_log.rowId
+                          AND later.seq > change_log.seq)
+    """, (start, stop))
+    return cur.rowcount
+
+
+def _purge_batch(cur, start, stop):
+    # Entries of [start, stop), all older than the retention period; the
+    # purged seq is recorded in the same transaction
+    cur.execute("DELETE FROM change_log WHERE seq >= ? AND seq < ?", (start, stop))
+    purged = cur.rowcount
+    cur.execute("UPDATE change_log_compaction SET purgedSeq = MAX(purgedSeq, ?) WHERE id = 1",
+                (stop - 1,))
+    return purged
+
+
+def _read(sql, params=()):
+    conn = db.connect_db()
+    try:
+        return conn.execute(sql, params).fetchone()
+    finally:
+        conn.close()
+
+
+def _in_batches(batch, first, last):
+    # Run `batch` over consecutive seq windows of CHANGE_LOG_BATCH_SIZE
+    # existing entries (seqs have gaps once the log was compacted)
+    total = 0
+    start = first
+    while start <= last:
+        end, = _read("""
+            SELECT MAX(seq) FROM (SELECT seq FROM change_log
+                                   WHERE seq >= ? AND seq <= ? ORDER BY seq LIMIT ?)
+        """, (start, last, CHANGE_LOG_BATCH_SIZE))
+        if end is None:
+            break
+        total += db.execute_write(batch, start, end + 1)
+        start = end + 1
+        time.sleep(CHANGE_LOG_PAUSE_SECONDS)
+    return total
+
+
+def compact(retention_days=CHANGE_LOG_RETENTION_DAYS, now=None, interval=None):
+    """
+    Compact change_log in batches. With `interval`, does nothing and
+    returns None when the last compaction is more recent than that many
+    seconds; otherwise returns the rows collapsed and purged.
+    """
+    now = time.time() if now is None else now
+    if not db.execute_write(_claim, now, interval):
+        return None
+
+    # Old entries first: they need not be collapsed
+    cutoff = f"-{max(int(retention_days), 0)} days"
+    first, purged_seq = _read("""
+        SELECT MIN(seq), MAX(seq) FROM change_log
+         WHERE changedAt < strftime('%Y-%m-%dT%H:%M:%SZ', 'now', ?)
+    """, (cutoff,))
+    purged = 0
+    if purged_seq is not None:
+        purged = _in_batches(_purge_batch, first, purged_seq)
+
+    first, last = _read("SELECT MIN(seq), MAX(seq) FROM change_log")
+    collapsed = 0
+    if first is not None:
+        collapsed = _in_batches(_collapse_batch, first, last)
+    return {'collapsed': collapsed, 'purged': purged}
+
+
+def compact_if_due():
+    """
+    Scheduled compaction; the database is only asked once per period per
+    process. Returns the compaction counts, or None when not due.
+    """
+    global _next_check
+    now = time.time()
+    if now < _next_check:
+        return None
+    _next_check = now + CHANGE_LOG_COMPACT_SECONDS
+    return compact(CHANGE_LOG_RETENTION_DAYS, now, CHANGE_LOG_COMPACT_SECONDS)
@@ -1,6 +1,8 @@
 import sqlite3
+import sys
 
-conn = sqlite3.connect('database.db')
+# Usage : python database.py [chemin_de_la_base]   (par défaut database.db)
+conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'database.db')
 conn.execute("PRAGMA foreign_keys = ON;")
 cur = conn.cursor()
 
@@ -120,10 +122,19 @@ CREATE TABLE IF NOT EXISTS order_items (
     orderId INTEGER,
     productId INTEGER,
     quantity INTEGER,
+    price REAL,
     FOREIGN KEY(orderId) REFERENCES orders(orderId),
     FOREIGN KEY(productId) REFERENCES products(productId)
 );
 ''')
+# Prix unitaire payé, figé à la commande. Bases créées avant la colonne :
+# les lignes existantes reçoivent le prix actuel du produit
+if 'price' not in [col[1] for col in cur.execute("PRAGMA table_info(order_items)")]:
+    cur.execute("ALTER TABLE order_items ADD COLUMN price REAL")
+    cur.execute('''
+    UPDATE order_items
+       SET price = (SELECT p.price FROM products p WHERE p.productId = order_items.productId)
+    ''')
 
 cur.execute('''
 CREATE TABLE IF NOT EXISTS avis (
@@ -216,7 +227,232 @@ CREATE TABLE IF NOT EXISTS messages (
 ''')
 
 
+cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_orderDate ON orders(orderDate);")
+# Historique des commandes d'un client (/account/orders), le plus récent d'abord
+cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_userId_orderDate ON orders(userId, orderDate);")
+cur.execute("CREATE INDEX IF NOT EXISTS idx_order_items_orderId ON order_items(orderId);")
+cur.execute("CREATE INDEX IF NOT EXISTS idx_pca_productId ON product_category_attributes(productId);")
+cur.execute("CREATE INDEX IF NOT EXISTS idx_produits_details_productId ON produits_details(productId);")
+
+# Suivi des modifications par table : chaque INSERT/UPDATE/DELETE incrémente
+# la version de la table. L'API s'en sert pour les en-têtes ETag/Last-Modified.
+cur.execute('''
+CREATE TABLE IF NOT EXISTS table_versions (
+    tableName TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updatedAt TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+);
+''')
+
+for table in ('products', 'categories', 'orders', 'order_items', 'users', 'product_media',
+              'category_attributes', 'product_category_attributes', 'produits_details'):
+    cur.execute("INSERT OR IGNORE INTO table_versions (tableName) VALUES (?)", (table,))
+    for op in ('INSERT', 'UPDATE', 'DELETE'):
+        trigger = f"trg_{table}_{op.lower()}_version"
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+        cur.execute(f'''
+        CREATE TRIGGER {trigger}
+        AFTER {op} ON {table}
+        BEGIN
+            UPDATE table_versions
+               SET version = version + 1,
+                   updatedAt = strftime('%Y-%m-%dT%H:%M:%SZ', 'now')
+             WHERE tableName = '{table}';
+        END;
+        ''')
+
+# Journal des modifications (flux /api/changes) : une ligne par INSERT/UPDATE/DELETE
+cur.execute('''
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tableName TEXT NOT NULL,
+    rowId INTEGER NOT NULL,
+    op TEXT CHECK(op IN ('insert', 'update', 'delete')),
+    changedAt TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+);
+''')
+
+# Dernière entrée de chaque ligne, parcourue par la compaction (change_log.py)
+cur.execute("CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(tableName, rowId, seq);")
+
+# Dernier seq supprimé par la compaction : un curseur plus ancien doit resynchroniser.
+# compactedAt : date (epoch) de la dernière compaction planifiée (change_log.py)
+cur.execute('''
+CREATE TABLE IF NOT EXISTS change_log_compaction (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    purgedSeq INTEGER NOT NULL DEFAULT 0,
+    compactedAt REAL NOT NULL DEFAULT 0
+);
+''')
+cur.execute("INSERT OR IGNORE INTO change_log_compaction (id) VALUES (1)")
+
+for table, pk in (('products', 'productId'), ('orders', 'orderId'), ('order_items', 'id')):
+    for op in ('INSERT', 'UPDATE', 'DELETE'):
+        trigger = f"trg_{table}_{op.lower()}_changelog"
+        row = 'OLD' if op == 'DELETE' else 'NEW'
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+        cur.execute(f'''
+        CREATE TRIGGER {trigger}
+        AFTER {op} ON {table}
+        BEGIN
+            INSERT INTO change_log (tableName, rowId, op)
+            VALUES ('{table}', {row}.{pk}, '{op.lower()}');
+        END;
+        ''')
+
+# Les attributs font partie du produit : leurs modifications sont journalisées
+# comme une mise à jour du produit concerné (index des facettes, flux /api/changes)
+for table in ('produits_details', 'product_category_attributes'):
+    for op in ('INSERT', 'UPDATE', 'DELETE'):
+        trigger = f"trg_{table}_{op.lower()}_changelog"
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    cur.execute(f'''
+    CREATE TRIGGER trg_{table}_insert_changelog
+    AFTER INSERT ON {table}
+    BEGIN
+        INSERT INTO change_log (tableName, rowId, op) VALUES ('products', NEW.productId, 'update');
+    END;
+    ''')
+    cur.execute(f'''
+    CREATE TRIGGER trg_{table}_update_changelog
+    AFTER UPDATE ON {table}
+    BEGIN
+        INSERT INTO change_log (tableName, rowId, op) VALUES ('products', NEW.productId, 'update');
+        INSERT INTO change_log (tableName, rowId, op)
+        SELECT 'products', OLD.productId, 'update' WHERE OLD.productId IS NOT NEW.productId;
+    END;
+    ''')
+    # Pas d'entrée pour les attributs purgés après la suppression du produit
+    cur.execute(f'''
+    CREATE TRIGGER trg_{table}_delete_changelog
+    AFTER DELETE ON {table}
+    WHEN EXISTS (SELECT 1 FROM products WHERE productId = OLD.productId)
+    BEGIN
+        INSERT INTO change_log (tableName, rowId, op) VALUES ('products', OLD.productId, 'update');
+    END;
+    ''')
+
+# Renommer ou supprimer un attribut de catégorie touche tous les produits qui l'utilisent
+for op in ('UPDATE', 'DELETE'):
+    trigger = f"trg_category_attributes_{op.lower()}_changelog"
+    cur.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    cur.execute(f'''
+    CREATE TRIGGER {trigger}
+    AFTER {op} ON category_attributes
+    BEGIN
+        INSERT INTO change_log (tableName, rowId, op)
+        SELECT 'products', productId, 'update' FROM product_category_attributes WHERE attrId = OLD.attrId;
+    END;
+    ''')
 
+# Popularité des produits : compteurs de vues / ajouts au panier alimentés par
+# lots (popularity.py), score à décroissance exponentielle recalculé en tâche de fond
+cur.execute('''
+CREATE TABLE IF NOT EXISTS product_stats (
+    productId INTEGER PRIMARY KEY,
+    views INTEGER NOT NULL DEFAULT 0,
+    carts INTEGER NOT NULL DEFAULT 0,
+    pendingViews INTEGER NOT NULL DEFAULT 0,
+    pendingCarts INTEGER NOT NULL DEFAULT 0,
+    score REAL NOT NULL DEFAULT 0,
+    FOREIGN KEY (productId) REFERENCES products(productId) ON DELETE CASCADE
+);
+''')
+cur.execute("CREATE INDEX IF NOT EXISTS idx_product_stats_score ON product_stats(score);")
+
+cur.execute('''
+CREATE TABLE IF NOT EXISTS popularity_refresh (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    refreshedAt REAL NOT NULL DEFAULT (strftime('%s', 'now'))
+);
+''')
+cur.execute("INSERT OR IGNORE INTO popularity_refresh (id) VALUES (1)")
+# Version incrémentée à chaque recalcul des scores (pas de trigger : écritures par lots)
+cur.execute("INSERT OR IGNORE INTO table_versions (tableName) VALUES ('product_stats')")
+
+# "Fréquemment achetés ensemble" (bought_together.py) : nombre de commandes
+# contenant chaque paire de produits (productA < productB), puis les K
+# meilleurs voisins de chaque produit pour l'affichage
+cur.execute('''
+CREATE TABLE IF NOT EXISTS co_purchase_counts (
+    productA INTEGER NOT NULL,
+    productB INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (productA, productB)
+) WITHOUT ROWID;
+''')
+cur.execute("CREATE INDEX IF NOT EXISTS idx_co_purchase_counts_productB ON co_purchase_counts(productB);")
+
+cur.execute('''
+CREATE TABLE IF NOT EXISTS bought_together (
+    productId INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    otherId INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (productId, rank)
+) WITHOUT ROWID;
+''')
+
+# Dernière commande prise en compte : les mises à jour ne lisent que les suivantes
+cur.execute('''
+CREATE TABLE IF NOT EXISTS bought_together_state (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    lastOrderId INTEGER NOT NULL DEFAULT 0
+);
+''')
+cur.execute("INSERT OR IGNORE INTO bought_together_state (id) VALUES (1)")
+
+# "Produits similaires" (similar.py) : les K produits les plus proches de
+# chaque produit (similarité cosinus TF-IDF du nom et de la description)
+cur.execute('''
+CREATE TABLE IF NOT EXISTS similar_products (
+    productId INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    otherId INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (productId, rank)
+) WITHOUT ROWID;
+''')
+# Retrouver les produits dont la liste contient un produit modifié
+cur.execute("CREATE INDEX IF NOT EXISTS idx_similar_products_otherId ON similar_products(otherId);")
+
+# Dernière entrée de change_log prise en compte par la mise à jour
+# incrémentale (NULL : jamais calculé, le premier passage est complet)
+cur.execute('''
+CREATE TABLE IF NOT EXISTS similar_state (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    seq INTEGER
+);
+''')
+cur.execute("INSERT OR IGNORE INTO similar_state (id) VALUES (1)")
+cur.execute("INSERT OR IGNORE INTO table_versions (tableName) VALUES ('similar_products')")
+
+# Suppressions en cascade (deletions.py) : la ligne supprimée disparaît tout de
+# suite, ses dépendances (panier, lignes de commande, avis, médias, messages...)
+# sont purgées par lots en arrière-plan ; step/purged donnent l'avancement,
+# attempts le nombre d'échecs (au-delà de DELETE_MAX_ATTEMPTS : 'failed')
+cur.execute('''
+CREATE TABLE IF NOT EXISTS deletions (
+    deletionId INTEGER PRIMARY KEY,
+    tableName TEXT NOT NULL CHECK(tableName IN ('users', 'orders', 'products')),
+    rowId INTEGER NOT NULL,
+    email TEXT,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'running', 'done', 'failed')),
+    step INTEGER NOT NULL DEFAULT 0,
+    steps INTEGER NOT NULL,
+    purged INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    requestedAt TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+    finishedAt TEXT
+);
+''')
+cur.execute("CREATE INDEX IF NOT EXISTS idx_deletions_status ON deletions(status);")
+# Colonnes parcourues par la purge (chaque lot est une lecture d'index)
+for table, column in (('order_items', 'productId'), ('kart', 'userId'), ('kart', 'productId'),
+                      ('avis', 'productId'), ('avis', 'userId'), ('product_media', 'productId'),
+                      ('messages', 'sender'), ('messages', 'receiver')):
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column});")
 
 
 conn.commit()
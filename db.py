@@ -0,0 +1,191 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# Every SQLite connection of the app is opened here so that statements can be
+# observed (metrics, profiling) without touching each route.
+
+DATABASE = 'database.db'
+
+# Writes through execute_write are serialized per process and retried on
+# SQLITE_BUSY with jittered exponential backoff until WRITE_DEADLINE seconds.
+WRITE_DEADLINE = float(os.environ.get('SQLITE_WRITE_DEADLINE', 5.0))
+WRITE_BUSY_TIMEOUT = 0.05
+WRITE_BACKOFF_BASE = 0.005
+WRITE_BACKOFF_MAX = 0.25
+
+# Callbacks called as listener(sql, seconds, cursor) after each statement and
+# as listener(seconds) after each connection is opened. sql is None when only
+# fetch time is reported for the cursor's current statement.
+# cursor.parameters holds the bound parameters (None for executemany).
+statement_listeners = []
+connect_listeners = []
+# Called as listener(wait_seconds, attempts, ok) after each execute_write:
+# wait_seconds is the time until the write lock was obtained.
+write_listeners = []
+
+
+def add_statement_listener(listener):
+    statement_listeners.append(listener)
+
+
+def add_connect_listener(listener):
+    connect_listeners.append(listener)
+
+
+def add_write_listener(listener):
+    write_listeners.append(listener)
+
+
+def _notify(sql, started, cursor):
+    elapsed = time.perf_counter() - started
+    for listener in statement_listeners:
+        listener(sql, elapsed, cursor)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor reporting the time spent in execute/executemany and in the
+    fetchall/fetchmany calls that step the statement.
+    """
+
+    parameters = None
+
+    def execute(self, sql, parameters=()):
+        self.parameters = parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _notify(sql, started, self)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.parameters = None
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _notify(sql, started, self)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._fetched(started)
+
+    def _fetched(self, started):
+        # Fetch time is added to the statement without counting it again
+        elapsed = time.perf_counter() - started
+        for listener in statement_listeners:
+            listener(None, elapsed, self)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect_db(path=None, row_factory=None, timeout=5.0):
+    """
+    Open a connection to the application database (DATABASE by default).
+    """
+    started = time.perf_counter()
+    conn = sqlite3.connect(path or DATABASE, timeout=timeout, factory=InstrumentedConnection)
+    elapsed = time.perf_counter() - started
+    for listener in connect_listeners:
+        listener(elapsed)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    return conn
+
+
+class WriteTimeout(sqlite3.OperationalError):
+    """
+    The database stayed locked by another writer past the write deadline.
+    """
+
+
+_write_lock = threading.Lock()
+
+
+def _reset_write_lock():
+    # A forked worker must not inherit the lock held by a parent thread
+    global _write_lock
+    _write_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_write_lock)
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def _backoff(attempt):
+    return random.uniform(0, min(WRITE_BACKOFF_MAX, WRITE_BACKOFF_BASE * 2 ** attempt))
+
+
+def _notify_write(wait, attempts, ok):
+    for listener in write_listeners:
+        listener(wait, attempts, ok)
+
+
+def execute_write(fn, *args, deadline=None, row_factory=None):
+    """
+    Run fn(cursor, *args) in one IMMEDIATE transaction and commit, returning
+    fn's result. Writers of this process take turns; busy errors from other
+    processes are retried with jittered backoff until the deadline, then
+    WriteTimeout is raised. Any other error rolls back and propagates.
+    """
+    started = time.perf_counter()
+    limit = started + (WRITE_DEADLINE if deadline is None else deadline)
+    attempts = 0
+    if not _write_lock.acquire(timeout=max(limit - time.perf_counter(), 0)):
+        _notify_write(time.perf_counter() - started, attempts, False)
+        raise WriteTimeout("timed out waiting for the write lock")
+    try:
+        while True:
+            attempts += 1
+            conn = connect_db(row_factory=row_factory, timeout=WRITE_BUSY_TIMEOUT)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                wait = time.perf_counter() - started
+                result = fn(conn.cursor(), *args)
+                conn.commit()
+                _notify_write(wait, attempts, True)
+                return result
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if not _is_busy(e):
+                    raise
+                delay = _backoff(attempts)
+                if time.perf_counter() + delay >= limit:
+                    _notify_write(time.perf_counter() - started, attempts, False)
+                    raise WriteTimeout(f"database still locked after {attempts} attempts") from e
+                time.sleep(delay)
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+    finally:
+        _write_lock.release()
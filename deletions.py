@@ -0,0 +1,277 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import jsonify
+
+import change_log
+import db
+from auth import is_admin_session
+
+# Background cascade deletion. Deleting a user, order or product removes its
+# row at once (it disappears from every page and API), in a short write
+# transaction that also records a job in `deletions`. The rows that referenced
+# it (cart lines, order lines, reviews, media, messages, ...) are then purged
+# by a background thread in batches of DELETE_BATCH_SIZE rows, one write
+# transaction per batch, so other writers get the lock between batches.
+# Progress is stored in the job row and listed at /admin/deletions; a job whose
+# purge keeps failing with an SQL error is given up after DELETE_MAX_ATTEMPTS
+# and marked 'failed' (a busy database only postpones it).
+# The same thread runs the scheduled change_log compaction (change_log.py).
+#
+# The parent row is removed before its dependents, which only works with
+# foreign key enforcement off (SQLite's default, and how db.connect_db opens
+# connections); schedule_deletion refuses to run on a connection with
+# PRAGMA foreign_keys = ON rather than fail halfway on a constraint.
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = int(os.environ.get('DELETE_BATCH_SIZE', 500))
+# Pause between two batches, leaving the write lock to the site
+DELETE_PAUSE_SECONDS = float(os.environ.get('DELETE_PAUSE_SECONDS', 0.05))
+# Failed purge batches (SQL errors, not lock timeouts) before a job is marked 'failed'
+DELETE_MAX_ATTEMPTS = int(os.environ.get('DELETE_MAX_ATTEMPTS', 5))
+IDLE_SECONDS = 2.0
+ADMIN_LIST_LIMIT = 50
+
+# Rows attached to a set of products, given as an SQL subquery on productId
+_PRODUCT_STEPS = (
+    ('kart', 'productId IN ({products})'),
+    ('order_items', 'productId IN ({products})'),
+    ('avis', 'productId IN ({products})'),
+    ('product_media', 'productId IN ({products})'),
+    ('produits_details', 'productId IN ({products})'),
+    ('product_category_attributes', 'productId IN ({products})'),
+    ('product_types', 'productId IN ({products})'),
+    ('product_stats', 'productId IN ({products})'),
+)
+
+
+def _product_steps(products):
+    return [(table, where.format(products=products)) for table, where in _PRODUCT_STEPS]
+
+
+# tableName -> ordered (table, WHERE clause) steps; :id is the deleted row id
+# and :email the user's email, captured when the user row was removed
+PLANS = {
+    'products': _product_steps(':id'),
+    'orders': [('order_items', 'orderId = :id')],
+    'users': [
+        ('kart', 'userId = :id'),
+        ('avis', 'userId = :id'),
+        ('rating_sellers', 'sellerId = :id OR raterId = :id'),
+        ('messages', 'sender = :email OR receiver = :email'),
+        ('order_items', 'orderId IN (SELECT orderId FROM orders WHERE userId = :id)'),
+        ('orders', 'userId = :id'),
+        # The seller's products, after everything that points to them
+        *_product_steps('SELECT productId FROM products WHERE maker = :id'),
+        ('products', 'maker = :id'),
+    ],
+}
+
+_PRIMARY_KEYS = {'products': 'productId', 'orders': 'orderId', 'users': 'userId'}
+# Column holding the user a products/orders row belongs to
+_OWNER_COLUMNS = {'products': 'maker', 'orders': 'userId'}
+
+_lock = threading.Lock()
+_pid = None
+_wakeup = threading.Event()
+
+
+def schedule_deletion(cur, table, row_id, owner=None):
+    """
+    Delete one users/orders/products row and queue the purge of the rows
+    depending on it. Meant for db.execute_write; returns False when the row
+    does not exist. With `owner`, a products/orders row is only deleted if
+    it belongs to that user id.
+    """
+    cur.execute("PRAGMA foreign_keys")
+    if cur.fetchone()[0]:
+        raise RuntimeError("cascade deletion needs PRAGMA foreign_keys = OFF")
+    email = None
+    if table == 'users':
+        cur.execute("SELECT email FROM users WHERE userId = ?", (row_id,))
+        row = cur.fetchone()
+        email = row[0] if row else None
+    where, params = f"{_PRIMARY_KEYS[table]} = ?", [row_id]
+    if owner is not None:
+        where += f" AND {_OWNER_COLUMNS[table]} = ?"
+        params.append(owner)
+    cur.execute(f"DELETE FROM {table} WHERE {where}", params)
+    if cur.rowcount == 0:
+        return False
+    cur.execute('''
+        INSERT INTO deletions (tableName, rowId, email, steps) VALUES (?, ?, ?, ?)
+    ''', (table, row_id, email, len(PLANS[table])))
+    return True
+
+
+def delete(table, row_id, owner=None):
+    """
+    Delete a users/orders/products row now and purge its dependents in the
+    background. Returns False when the row does not exist (or, with
+    `owner`, does not belong to that user).
+    """
+    found = db.execute_write(schedule_deletion, table, row_id, owner)
+    if found:
+        wake()
+    return found
+
+
+def _schedule_many(cur, table, row_ids, owner):
+    return {row_id for row_id in row_ids if schedule_deletion(cur, table, row_id, owner)}
+
+
+def delete_many(table, row_ids, owner=None):
+    """
+    delete() for several rows in one write transaction; returns the ids found.
+    """
+    found = db.execute_write(_schedule_many, table, sorted(set(row_ids)), owner)
+    if found:
+        wake()
+    return found
+
+
+def wake():
+    _ensure_started()
+    _wakeup.set()
+
+
+def _purge_batch(cur, deletion_id):
+    # Delete the next batch of the job's current step and record progress.
+    # State is re-read inside the write transaction, so several workers can
+    # share a job. Returns the rows deleted, or None when nothing is left.
+    cur.execute('''
+        SELECT tableName, rowId, email, step, status FROM deletions WHERE deletionId = ?
+    ''', (deletion_id,))
+    row = cur.fetchone()
+    if row is None or row[4] in ('done', 'failed'):
+        return None
+    table_name, row_id, email, step, _ = row
+    plan = PLANS[table_name]
+    if step >= len(plan):
+        cur.execute('''
+            UPDATE deletions SET status = 'done', finishedAt = strftime('%Y-%m-%dT%H:%M:%SZ', 'now')
+             WHERE deletionId = ?
+        ''', (deletion_id,))
+        return None
+
+    table, where = plan[step]
+    cur.execute(f'''
+        DELETE FROM {table}
+         WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT :limit)
+    ''', {'id': row_id, 'email': email, 'limit': DELETE_BATCH_SIZE})
+    deleted = cur.rowcount
+    cur.execute('''
+        UPDATE deletions
+           SET status = 'running',
+               step = step + ?,
+               purged = purged + ?
+         WHERE deletionId = ?
+    ''', (1 if deleted < DELETE_BATCH_SIZE else 0, deleted, deletion_id))
+    return table, deleted
+
+
+def _run_pending():
+    conn = db.connect_db()
+    try:
+        pending = [row[0] for row in conn.execute(
+            "SELECT deletionId FROM deletions WHERE status IN ('pending', 'running') ORDER BY deletionId")]
+    finally:
+        conn.close()
+    for deletion_id in pending:
+        while True:
+            try:
+                result = db.execute_write(_purge_batch, deletion_id)
+            except db.WriteTimeout:
+                # Busy database, not a failure of the job: retried on the next pass
+                logger.warning(f"purge of deletion {deletion_id} postponed: database busy")
+                break
+            except sqlite3.Error as e:
+                logger.error(f"purge of deletion {deletion_id} failed: {e}")
+                db.execute_write(_record_error, deletion_id, str(e))
+                break
+            if result is None:
+                break
+            time.sleep(DELETE_PAUSE_SECONDS)
+
+
+def _record_error(cur, deletion_id, error):
+    # The job is retried on the next pass, until DELETE_MAX_ATTEMPTS failures
+    cur.execute('''
+        UPDATE deletions
+           SET error = ?,
+               attempts = attempts + 1,
+               status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END,
+               finishedAt = CASE WHEN attempts + 1 >= ? THEN strftime('%Y-%m-%dT%H:%M:%SZ', 'now') END
+         WHERE deletionId = ?
+    ''', (error, DELETE_MAX_ATTEMPTS, DELETE_MAX_ATTEMPTS, deletion_id))
+
+
+def _run():
+    while True:
+        _wakeup.clear()
+        try:
+            _run_pending()
+        except sqlite3.Error as e:
+            logger.error(f"cascade deletion failed: {e}")
+        try:
+            change_log.compact_if_due()
+        except sqlite3.Error as e:
+            logger.error(f"change_log compaction failed: {e}")
+        _wakeup.wait(IDLE_SECONDS)
+
+
+def _ensure_started():
+    # One purge thread per process, restarted in forked workers
+    global _pid
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        _pid = os.getpid()
+        threading.Thread(target=_run, name='deletions', daemon=True).start()
+
+
+def deletions_view():
+    if not is_admin_session():
+        return jsonify({'error': 'Admin privileges required'}), 403
+    conn = db.connect_db(row_factory=sqlite3.Row)
+    try:
+        rows = conn.execute('''
+            SELECT * FROM deletions
+             ORDER BY status = 'done', deletionId DESC
+             LIMIT ?
+        ''', (ADMIN_LIST_LIMIT,)).fetchall()
+    finally:
+        conn.close()
+    jobs = []
+    for row in rows:
+        plan = PLANS[row['tableName']]
+        jobs.append({
+            'deletionId': row['deletionId'],
+            'tableName': row['tableName'],
+            'rowId': row['rowId'],
+            'status': row['status'],
+            'step': row['step'],
+            'steps': row['steps'],
+            'currentTable': plan[row['step']][0] if row['step'] < len(plan) else None,
+            'purged': row['purged'],
+            'attempts': row['attempts'],
+            'requestedAt': row['requestedAt'],
+            'finishedAt': row['finishedAt'],
+            'error': row['error'],
+        })
+    return jsonify({'deletions': jobs})
+
+
+def init_deletions(app):
+    """
+    Register /admin/deletions and make sure each worker process runs the
+    purge thread, so jobs left pending by a restart are resumed.
+    """
+    app.before_request(_ensure_started)
+    app.add_url_rule('/admin/deletions', 'admin_deletions', deletions_view)
@@ -0,0 +1,280 @@
+import logging
+import threading
+import time
+
+import sqlite3
+
+import db
+
+# Facet engine over the attribute tables (category_attributes +
+# product_category_attributes, and the free-form produits_details). Each
+# (attribute, value) pair maps to a bitset of product ids stored in a Python
+# int (bit n set = product n), so multi-facet filtering and per-value counts
+# are a few big-int AND/OR and popcount calls instead of EAV self-joins.
+# The index is built on first use and kept current from change_log, checked
+# at most every FACET_REFRESH_SECONDS.
+
+logger = logging.getLogger(__name__)
+
+FACET_PARAM = 'facet'
+MAX_FACET_VALUES = 30
+# Seconds between two checks of change_log
+FACET_REFRESH_SECONDS = 1.0
+
+CATEGORY_ATTRIBUTES_SQL = '''
+    SELECT pca.productId, ca.cle, pca.valeur
+      FROM product_category_attributes pca
+      JOIN category_attributes ca ON ca.attrId = pca.attrId
+'''
+DETAILS_SQL = "SELECT productId, cle, valeur FROM produits_details"
+
+
+def bitset(product_ids):
+    """
+    Bitset of an iterable of product ids, built in O(n) through a bytearray.
+    """
+    ids = list(product_ids)
+    if not ids:
+        return 0
+    buf = bytearray(max(ids) // 8 + 1)
+    for pid in ids:
+        buf[pid >> 3] |= 1 << (pid & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def _clean(text):
+    return (text or '').strip()
+
+
+def parse_facets(values):
+    """
+    {attribute: {value, ...}} from 'attribute:value' request arguments.
+    """
+    selected = {}
+    for item in values:
+        attribute, sep, value = item.partition(':')
+        attribute, value = _clean(attribute), _clean(value)
+        if sep and attribute and value:
+            selected.setdefault(attribute, set()).add(value)
+    return selected
+
+
+class FacetIndex:
+
+    def __init__(self):
+        self.postings = {}       # attribute -> {value: bitset}
+        self.categories = {}     # categoryId -> bitset
+        self.all_products = 0
+        self.product_pairs = {}  # productId -> [(attribute, value)], for updates
+        self.product_category = {}
+        self.seq = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()          # index data
+        self._refresh_lock = threading.Lock()  # one refresh at a time, reads outside _lock
+
+    def _set(self, product_id, category_id, pairs):
+        bit = 1 << product_id
+        self.all_products |= bit
+        if category_id is not None:
+            self.categories[category_id] = self.categories.get(category_id, 0) | bit
+            self.product_category[product_id] = category_id
+        for attribute, value in pairs:
+            values = self.postings.setdefault(attribute, {})
+            values[value] = values.get(value, 0) | bit
+        self.product_pairs[product_id] = pairs
+
+    def _remove(self, product_id):
+        mask = ~(1 << product_id)
+        self.all_products &= mask
+        category_id = self.product_category.pop(product_id, None)
+        if category_id is not None:
+            self.categories[category_id] &= mask
+        for attribute, value in self.product_pairs.pop(product_id, ()):
+            values = self.postings[attribute]
+            values[value] &= mask
+            if not values[value]:
+                del values[value]
+                if not values:
+                    del self.postings[attribute]
+
+    def build(self, conn):
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        seq = cur.fetchone()[0]
+
+        categories = {}
+        product_category = {}
+        for product_id, category_id in cur.execute("SELECT productId, categoryId FROM products"):
+            categories.setdefault(category_id, []).append(product_id)
+            product_category[product_id] = category_id
+
+        ids_by_pair = {}
+        product_pairs = {}
+        for sql in (CATEGORY_ATTRIBUTES_SQL, DETAILS_SQL):
+            for product_id, attribute, value in cur.execute(sql):
+                attribute, value = _clean(attribute), _clean(value)
+                if product_id not in product_category or not attribute or not value:
+                    continue
+                ids_by_pair.setdefault((attribute, value), []).append(product_id)
+                product_pairs.setdefault(product_id, []).append((attribute, value))
+
+        postings = {}
+        for (attribute, value), ids in ids_by_pair.items():
+            postings.setdefault(attribute, {})[value] = bitset(ids)
+
+        categories = {cid: bitset(ids) for cid, ids in categories.items() if cid is not None}
+        all_products = bitset(product_category)
+        with self._lock:
+            self.postings = postings
+            self.categories = categories
+            self.all_products = all_products
+            self.product_pairs = product_pairs
+            self.product_category = {pid: cid for pid, cid in product_category.items() if cid is not None}
+            self.seq = seq
+
+    def _load_products(self, cur, product_ids):
+        # {productId: (categoryId, pairs)} of the products that still exist
+        placeholders = ', '.join('?' for _ in product_ids)
+        cur.execute(f"SELECT productId, categoryId FROM products WHERE productId IN ({placeholders})",
+                    product_ids)
+        existing = dict(cur.fetchall())
+        pairs = {pid: [] for pid in existing}
+        for sql, column in ((CATEGORY_ATTRIBUTES_SQL, 'pca.productId'), (DETAILS_SQL, 'productId')):
+            cur.execute(f"{sql} WHERE {column} IN ({placeholders})", product_ids)
+            for product_id, attribute, value in cur.fetchall():
+                attribute, value = _clean(attribute), _clean(value)
+                if product_id in pairs and attribute and value:
+                    pairs[product_id].append((attribute, value))
+        return {pid: (category_id, pairs[pid]) for pid, category_id in existing.items()}
+
+    def _refresh(self):
+        # Full build the first time (or when change_log was compacted past
+        # our position), then only the products changed since. Caller holds
+        # _refresh_lock; the database is read without holding _lock.
+        conn = db.connect_db()
+        try:
+            if self.seq is None:
+                self.build(conn)
+                return
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT (SELECT purgedSeq FROM change_log_compaction WHERE id = 1),
+                       (SELECT COALESCE(MAX(seq), 0) FROM change_log)
+            """)
+            purged_seq, last_seq = cur.fetchone()
+            if (purged_seq or 0) > self.seq:
+                self.build(conn)
+                return
+            if last_seq <= self.seq:
+                return
+            cur.execute("""
+                SELECT DISTINCT rowId FROM change_log
+                 WHERE seq > ? AND seq <= ? AND tableName = 'products'
+                 ORDER BY rowId
+            """, (self.seq, last_seq))
+            changed = [row[0] for row in cur.fetchall()]
+            loaded = {}
+            for start in range(0, len(changed), 500):
+                loaded.update(self._load_products(cur, changed[start:start + 500]))
+            with self._lock:
+                for product_id in changed:
+                    self._remove(product_id)
+                    if product_id in loaded:
+                        self._set(product_id, *loaded[product_id])
+                self.seq = last_seq
+        except sqlite3.OperationalError as e:
+            logger.error(f"facet index refresh failed: {e}")
+        finally:
+            conn.close()
+
+    def refresh(self):
+        """
+        Build on first use, then apply product changes from change_log at
+        most every FACET_REFRESH_SECONDS.
+        """
+        if self.seq is not None and time.monotonic() - self.checked_at < FACET_REFRESH_SECONDS:
+            return
+        with self._refresh_lock:
+            now = time.monotonic()
+            if self.seq is not None and now - self.checked_at < FACET_REFRESH_SECONDS:
+                return
+            self.checked_at = now
+            self._refresh()
+
+    def search(self, selected, base=None, category_id=None):
+        """
+        Apply the selected facets (OR within an attribute, AND across
+        attributes) to `base` (all products by default) and the category.
+        Returns (matching bitset, facets) where facets lists every attribute
+        present in the results with its values and counts; counts of an
+        attribute ignore its own selection, so siblings stay selectable.
+        """
+        self.refresh()
+        with self._lock:
+            return self._search(selected, base, category_id)
+
+    def _search(self, selected, base, category_id):
+        scope = self.all_products if base is None else base
+        if category_id is not None:
+            scope &= self.categories.get(category_id, 0)
+
+        masks = {}
+        for attribute, values in selected.items():
+            postings = self.postings.get(attribute, {})
+            mask = 0
+            for value in values:
+                mask |= postings.get(value, 0)
+            masks[attribute] = mask
+
+        result = scope
+        for mask in masks.values():
+            result &= mask
+
+        facets = []
+        for attribute in sorted(self.postings):
+            others = scope
+            for other, mask in masks.items():
+                if other != attribute:
+                    others &= mask
+            if not others:
+                continue
+            chosen = selected.get(attribute, set())
+            values = []
+            for value, bits in self.postings[attribute].items():
+                count = bin(bits & others).count('1')
+                if count or value in chosen:
+                    values.append({'value': value, 'count': count, 'selected': value in chosen})
+            if values:
+                values.sort(key=lambda v: (not v['selected'], -v['count'], v['value']))
+                facets.append({'name': attribute, 'values': values[:MAX_FACET_VALUES]})
+        return result, facets
+
+
+def member_test(bits):
+    """
+    Fast membership predicate for a bitset (shifting a large int per lookup
+    would copy it every time).
+    """
+    buf = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    size = len(buf)
+    return lambda product_id: (product_id >> 3) < size and (buf[product_id >> 3] >> (product_id & 7)) & 1 == 1
+
+
+def facet_args(selected):
+    return sorted(f"{attribute}:{value}" for attribute, values in selected.items() for value in values)
+
+
+def toggle_links(facets, selected):
+    """
+    Add to each facet value the 'facet' arguments of the page with that
+    value toggled, for the templates' links.
+    """
+    current = set(facet_args(selected))
+    for facet in facets:
+        for value in facet['values']:
+            item = f"{facet['name']}:{value['value']}"
+            value['toggle'] = sorted(current ^ {item})
+    return facets
+
+
+facet_index = FacetIndex()
@@ -0,0 +1,290 @@
+"""
+Synthetic data generator for scale testing.
+
+Creates a database with the schema of database.py and fills it with users,
+sellers, products, carts, orders, reviews and messages. Product popularity
+follows a Zipf distribution (a few hot products get most carts, orders and
+reviews) and conversation lengths are heavy-tailed. The same --seed always
+produces the same database.
+
+    python generate_data.py --output bench.db --products 200000 --orders 1000000
+"""
+import argparse
+import hashlib
+import itertools
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ADJECTIVES = [
+    'Classique', 'Moderne', 'Élégant', 'Robuste', 'Compact', 'Léger', 'Premium',
+    'Vintage', 'Sport', 'Écologique', 'Confortable', 'Pratique', 'Luxe', 'Mini',
+]
+NOUNS = [
+    'Chaise', 'Lampe', 'Montre', 'Sac', 'Casque', 'Chaussure', 'Veste', 'Table',
+    'Tasse', 'Clavier', 'Souris', 'Parfum', 'Livre', 'Ballon', 'Poêle', 'Robe',
+]
+COLORS = ['Noir', 'Blanc', 'Rouge', 'Bleu', 'Vert', 'Gris', 'Beige', 'Rose']
+WORDS = (
+    'qualité livraison rapide garantie confort design durable original pratique '
+    'idéal cadeau famille maison bureau voyage quotidien résistant élégant'
+).split()
+FIRST_NAMES = ['Yasmine', 'Omar', 'Sara', 'Karim', 'Lina', 'Mehdi', 'Nora', 'Adam', 'Salma', 'Youssef']
+LAST_NAMES = ['El Amrani', 'Benali', 'Haddad', 'Martin', 'Bernard', 'Alaoui', 'Chraibi', 'Dubois']
+CITIES = ['Casablanca', 'Rabat', 'Marrakech', 'Fès', 'Tanger', 'Agadir', 'Paris', 'Lyon']
+ATTRIBUTES = {'couleur': COLORS, 'taille': ['XS', 'S', 'M', 'L', 'XL'], 'marque': ['Atlas', 'Nova', 'Zenit', 'Orion', 'Kora']}
+
+# Tracking triggers (table_versions, change_log) are dropped during the load
+# and recreated afterwards, otherwise every generated row would be logged.
+TRACKING_TRIGGER_SUFFIXES = ('_version', '_changelog')
+CHUNK_SIZE = 50000
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_many(conn, sql, rows):
+    count = 0
+    for chunk in chunked(rows):
+        conn.executemany(sql, chunk)
+        count += len(chunk)
+    return count
+
+
+def zipf_cum_weights(n, exponent):
+    total = 0.0
+    weights = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** exponent
+        weights.append(total)
+    return weights
+
+
+class Generator:
+
+    def __init__(self, conn, args):
+        self.conn = conn
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = datetime(2026, 1, 1)
+        self.images = sorted(
+            f for f in os.listdir(os.path.join(BASE_DIR, 'static', 'uploads'))
+            if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))
+        ) or ['default_product.png']
+
+    def random_date(self, days=365):
+        return self.now - timedelta(seconds=self.rng.randrange(days * 86400))
+
+    def users(self):
+        args, rng = self.args, self.rng
+        password = hashlib.md5(b'password').hexdigest()
+
+        def rows():
+            for i in range(args.buyers + args.sellers):
+                is_seller = i >= args.buyers
+                yield (
+                    'vendeur' if is_seller else 'acheteur', password,
+                    f"{'seller' if is_seller else 'user'}{i}@example.com",
+                    rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                    f"{rng.randrange(1, 300)} rue {rng.choice(LAST_NAMES)}", '',
+                    f"{rng.randrange(10000, 99999)}", rng.choice(CITIES), '', 'Maroc',
+                    f"06{rng.randrange(10**7, 10**8)}", 1
+                )
+        insert_many(self.conn, '''
+            INSERT INTO users (type, password, email, firstName, lastName, address1, address2,
+                               zipcode, city, state, country, phone, acceptation)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows())
+        # trg_users_acceptation_after marks new sellers as pending: accept most of them
+        self.conn.execute("UPDATE users SET acceptation = 1 WHERE type = 'vendeur' AND userId % 10 != 0")
+        ids = self.conn.execute("SELECT userId, type, email FROM users ORDER BY userId").fetchall()
+        self.buyer_ids = [r[0] for r in ids if r[1] == 'acheteur']
+        self.seller_ids = [r[0] for r in ids if r[1] == 'vendeur']
+        self.email = {r[0]: r[2] for r in ids}
+
+    def products(self):
+        args, rng = self.args, self.rng
+        self.category_ids = [r[0] for r in self.conn.execute("SELECT categoryId FROM categories")]
+        # Sellers are skewed too: a few big shops own most of the catalog
+        seller_weights = zipf_cum_weights(len(self.seller_ids), 0.8)
+        makers = rng.choices(self.seller_ids, cum_weights=seller_weights, k=args.products)
+
+        def rows():
+            for i, maker in enumerate(makers):
+                yield (
+                    f"{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} {rng.choice(COLORS)} {i}",
+                    round(rng.lognormvariate(3.5, 1.0), 2),
+                    ' '.join(rng.choices(WORDS, k=rng.randrange(8, 30))),
+                    rng.choice(self.images), rng.randrange(0, 200),
+                    rng.choice(self.category_ids), maker
+                )
+        insert_many(self.conn, '''
+            INSERT INTO products (name, price, description, image, stock, categoryId, maker)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows())
+        rows = self.conn.execute("SELECT productId, price FROM products ORDER BY productId").fetchall()
+        self.product_ids = [r[0] for r in rows]
+        self.price = dict(rows)
+        # Popularity rank is independent from productId
+        self.hot_products = self.product_ids[:]
+        rng.shuffle(self.hot_products)
+        self.product_weights = zipf_cum_weights(len(self.hot_products), args.zipf)
+
+    def pick_products(self, k):
+        return self.rng.choices(self.hot_products, cum_weights=self.product_weights, k=k)
+
+    def attributes(self):
+        rng = self.rng
+        attr_rows = [(cat, key) for cat in self.category_ids for key in ATTRIBUTES]
+        self.conn.executemany("INSERT INTO category_attributes (categoryId, cle) VALUES (?, ?)", attr_rows)
+        attrs = {}
+        for attr_id, cat, key in self.conn.execute("SELECT attrId, categoryId, cle FROM category_attributes"):
+            attrs.setdefault(cat, []).append((attr_id, key))
+        categories = dict(self.conn.execute("SELECT productId, categoryId FROM products"))
+
+        def rows():
+            for product_id in self.product_ids:
+                for attr_id, key in attrs.get(categories[product_id], ()):
+                    yield (product_id, attr_id, rng.choice(ATTRIBUTES[key]))
+        insert_many(self.conn, '''
+            INSERT INTO product_category_attributes (productId, attrId, valeur) VALUES (?, ?, ?)
+        ''', rows())
+
+    def carts(self):
+        rng = self.rng
+        owners = rng.sample(self.buyer_ids, min(self.args.carts, len(self.buyer_ids)))
+
+        def rows():
+            for user_id in owners:
+                for product_id in self.pick_products(rng.randrange(1, 6)):
+                    yield (user_id, product_id)
+        insert_many(self.conn, "INSERT INTO kart (userId, productId) VALUES (?, ?)", rows())
+
+    def orders(self):
+        args, rng = self.args, self.rng
+        buyers = rng.choices(self.buyer_ids, k=args.orders)
+        dates = sorted(self.random_date() for _ in range(args.orders))
+        items = []
+
+        def order_rows():
+            for order_id, (user_id, date) in enumerate(zip(buyers, dates), start=1):
+                lines = self.pick_products(min(1 + int(rng.expovariate(0.6)), 12))
+                total = 0.0
+                for product_id in lines:
+                    quantity = rng.choice((1, 1, 1, 2, 3))
+                    total += self.price[product_id] * quantity
+                    items.append((order_id, product_id, quantity, self.price[product_id]))
+                yield (order_id, user_id, date.isoformat(), round(total, 2))
+        insert_many(self.conn, "INSERT INTO orders (orderId, userId, orderDate, total) VALUES (?, ?, ?, ?)", order_rows())
+        insert_many(self.conn, "INSERT INTO order_items (orderId, productId, quantity, price) VALUES (?, ?, ?, ?)", items)
+
+    def reviews(self):
+        rng = self.rng
+        products = self.pick_products(self.args.reviews)
+
+        def rows():
+            for product_id in products:
+                yield (
+                    rng.choice(self.buyer_ids), product_id,
+                    ' '.join(rng.choices(WORDS, k=rng.randrange(3, 15))),
+                    rng.choices((1, 2, 3, 4, 5), weights=(5, 5, 15, 35, 40))[0],
+                    self.random_date().isoformat(' ')
+                )
+        insert_many(self.conn, '''
+            INSERT INTO avis (userId, productId, commentaire, note, date) VALUES (?, ?, ?, ?, ?)
+        ''', rows())
+
+    def messages(self):
+        args, rng = self.args, self.rng
+
+        def rows():
+            remaining = args.messages
+            while remaining > 0:
+                buyer = self.email[rng.choice(self.buyer_ids)]
+                seller = self.email[rng.choice(self.seller_ids)]
+                # Pareto-distributed length: most conversations are short, some very long
+                length = min(remaining, int(rng.paretovariate(1.2) * 3))
+                when = self.random_date()
+                for _ in range(length):
+                    sender, receiver = (buyer, seller) if rng.random() < 0.5 else (seller, buyer)
+                    when += timedelta(seconds=rng.randrange(5, 3600))
+                    yield (sender, receiver, ' '.join(rng.choices(WORDS, k=rng.randrange(2, 12))),
+                           when.isoformat(' '))
+                remaining -= length
+        insert_many(self.conn, '''
+            INSERT INTO messages (sender, receiver, content, timestamp) VALUES (?, ?, ?, ?)
+        ''', rows())
+
+
+def create_schema(path):
+    subprocess.run([sys.executable, os.path.join(BASE_DIR, 'database.py'), path], check=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic DirectShop database.")
+    parser.add_argument('--output', default='bench.db', help="database file to create (default: bench.db)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--buyers', type=int, default=10000)
+    parser.add_argument('--sellers', type=int, default=500)
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--carts', type=int, default=5000, help="number of buyers with a non-empty cart")
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--reviews', type=int, default=50000)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--zipf', type=float, default=1.1, help="skew of product popularity")
+    parser.add_argument('--force', action='store_true', help="overwrite --output if it exists")
+    args = parser.parse_args(argv)
+
+    if args.buyers < 1 or args.sellers < 1 or args.products < 1:
+        parser.error("--buyers, --sellers and --products must be at least 1")
+    if os.path.exists(args.output):
+        if not args.force:
+            parser.error(f"{args.output} already exists (use --force to overwrite)")
+        os.remove(args.output)
+
+    started = time.perf_counter()
+    create_schema(args.output)
+
+    conn = sqlite3.connect(args.output)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    triggers = [(name, sql) for name, sql in triggers if name.endswith(TRACKING_TRIGGER_SUFFIXES)]
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+
+    generator = Generator(conn, args)
+    for step in ('users', 'products', 'attributes', 'carts', 'orders', 'reviews', 'messages'):
+        step_started = time.perf_counter()
+        getattr(generator, step)()
+        conn.commit()
+        print(f"{step:<12} {time.perf_counter() - step_started:6.2f}s")
+
+    for _, sql in triggers:
+        conn.execute(sql)
+    conn.execute("""
+        UPDATE table_versions
+           SET version = version + 1,
+               updatedAt = strftime('%Y-%m-%dT%H:%M:%SZ', 'now')
+    """)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    print(f"{args.output} generated in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
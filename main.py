@@ -1,34 +1,71 @@
 from flask import Flask,jsonify, render_template, request, redirect, url_for, session, flash, current_app
 from api import api_bp
+from catalog_cache import catalog_fragments, catalog_version
+from db import connect_db, execute_write, WriteTimeout
+from metrics import init_metrics
+from rate_limit import init_rate_limit
+from query_profiler import init_query_profiler
+from request_profiler import init_request_profiler
+from write_behind import write_behind
+import popularity
+import bought_together
+import similar
+import deletions
+import media
+from suggest import SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, init_suggest, suggest_index
+from facets import FACET_PARAM, bitset, facet_args, facet_index, member_test, parse_facets, toggle_links
 import sqlite3, hashlib, os
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import time
-from flask_cors import CORS
-import requests
-import bs4
 
 
+# Les routes de ce module sont déclarées sur `app` ; create_app() la configure
+# (blueprint API, CORS, métriques, limites...) une seule fois, dès l'import en
+# fin de module, si bien que `gunicorn main:app` et `flask --app main run`
+# servent l'application complète. La configuration ne fait qu'enregistrer des
+# hooks : rien n'est ouvert à l'import (connexions, threads), un serveur peut
+# charger l'application avant de forker ses workers, chacun démarre ses
+# propres ressources à la première requête.
 app = Flask(__name__)
-app.secret_key = 'ef4072ab74fab1912276e53ff09198eb82ed8f0a4f470dfd60d68bb1a596ee12'
-app.register_blueprint(api_bp)
-CORS(app)
-
 
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'jpeg', 'jpg', 'png', 'gif','pdf'}
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+
+def create_app(config=None):
+    """
+    Configure and return the application; later calls only apply `config`.
+    """
+    if 'directshop' in app.extensions:
+        app.config.update(config or {})
+        return app
+    from flask_cors import CORS
+
+    app.secret_key = os.environ.get('SECRET_KEY', 'ef4072ab74fab1912276e53ff09198eb82ed8f0a4f470dfd60d68bb1a596ee12')
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config.update(config or {})
+    app.register_blueprint(api_bp)
+    CORS(app, expose_headers='Authorization')
+    init_metrics(app)
+    init_rate_limit(app)
+    init_query_profiler(app)
+    init_request_profiler(app)
+    deletions.init_deletions(app)
+    media.init_media(app)
+    init_suggest(app)
+    app.extensions['directshop'] = True
+    return app
 
 
 
 def get_db_connection():
-    conn = sqlite3.connect('database.db')
+    conn = connect_db()
     conn.row_factory = sqlite3.Row
     return conn
 
 def getLoginDetails():
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         conn.row_factory = sqlite3.Row  
         cur = conn.cursor()
         if 'email' not in session:
@@ -79,7 +116,7 @@ def profileView():
     if 'email' not in session:
         return redirect(url_for('root'))
     loggedIn, firstName, noOfItems = getLoginDetails()
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute(
             "SELECT userId, email, firstName, lastName, address1, address2, zipcode, city, state, country, phone "
@@ -97,6 +134,13 @@ def profileView():
 
 
 
+def insert_avis(cur, user_id, product_id, commentaire, note):
+    cur.execute(
+        "INSERT INTO avis (userId, productId, commentaire, note) VALUES (?, ?, ?, ?)",
+        (user_id, product_id, commentaire, note)
+    )
+
+
 @app.route('/ajouterAvis', methods=['POST'])
 def ajouter_avis():
     if 'email' not in session:
@@ -117,22 +161,48 @@ def ajouter_avis():
     note        = int(request.form['note'])
     commentaire = request.form['commentaire'].strip()
 
+    conn.close()
+
     try:
-        cur.execute(
-            "INSERT INTO avis (userId, productId, commentaire, note) VALUES (?, ?, ?, ?)",
-            (user_id, product_id, commentaire, note)
-        )
-        conn.commit()
+        execute_write(insert_avis, user_id, product_id, commentaire, note)
         flash("Merci pour votre avis !", 'success')
     except sqlite3.Error as e:
         app.logger.error(f"SQLite error in ajouter_avis: {e}")
         flash("Une erreur est survenue. Veuillez réessayer plus tard.", 'danger')
-    finally:
-        conn.close()
 
     return redirect(url_for('productDescription', productId=product_id))
 
 
+def place_order(cur, userId):
+    """
+    Turn the cart of userId into an order. The cart is read inside the write
+    transaction so the order matches what is deleted from kart.
+    """
+    cur.execute("""
+        SELECT p.productId, p.price
+        FROM products p
+        JOIN kart k ON p.productId = k.productId
+        WHERE k.userId = ?
+    """, (userId,))
+    products = cur.fetchall()
+    totalPrice = sum(prod[1] for prod in products)
+    orderDate = datetime.utcnow().isoformat()
+
+    cur.execute("""
+        INSERT INTO orders (userId, orderDate, total)
+        VALUES (?, ?, ?)
+    """, (userId, orderDate, totalPrice))
+    orderId = cur.lastrowid
+
+    cur.executemany("""
+        INSERT INTO order_items (orderId, productId, quantity, price)
+        VALUES (?, ?, ?, ?)
+    """, [(orderId, prod[0], 1, prod[1]) for prod in products])
+
+    cur.execute("DELETE FROM kart WHERE userId = ?", (userId,))
+    return orderId
+
+
 @app.route("/checkout", methods=["GET", "POST"])
 def checkout():
     if 'email' not in session:
@@ -141,7 +211,7 @@ def checkout():
     loggedIn, firstName, noOfItems = getLoginDetails()
     email = session['email']
 
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
 
@@ -162,22 +232,13 @@ def checkout():
         totalPrice = sum(prod["price"] for prod in products)
 
         if request.method == "POST":
-            orderDate = datetime.utcnow().isoformat()
-
-            cur.execute("""
-                INSERT INTO orders (userId, orderDate, total)
-                VALUES (?, ?, ?)
-            """, (userId, orderDate, totalPrice))
-            orderId = cur.lastrowid
-
-            for prod in products:
-                cur.execute("""
-                    INSERT INTO order_items (orderId, productId, quantity)
-                    VALUES (?, ?, ?)
-                """, (orderId, prod["productId"], 1))
-
-            cur.execute("DELETE FROM kart WHERE userId = ?", (userId,))
-            conn.commit()
+            try:
+                orderId = execute_write(place_order, userId)
+            except WriteTimeout:
+                app.logger.warning(f"checkout: database busy for user {userId}")
+                if request.is_json:
+                    return jsonify({"error": "Service temporarily unavailable, please retry"}), 503
+                return "Service momentanément indisponible, veuillez réessayer.", 503
 
             if request.is_json:
                 return jsonify(status="success")
@@ -204,6 +265,7 @@ def root(sorting):
     loggedIn, firstName, noOfItems, user_type = getUserSessionDetails()
     q = request.args.get('query', '').strip()
     selected_category_id = request.args.get('category_id', type=int)
+    selected_facets = parse_facets(request.args.getlist(FACET_PARAM))
 
     sort_options = {
         "price_asc": "ORDER BY price ASC",
@@ -211,54 +273,89 @@ def root(sorting):
         "stock_asc": "ORDER BY stock ASC",
         "stock_desc": "ORDER BY stock DESC",
     }
-    sort_query = sort_options.get(sorting, "ORDER BY name ASC")
-
-    where_clauses = []
-    params = []
-
-    if q:
-        where_clauses.append("name LIKE ?")
-        params.append(f"%{q}%")
+    join_sql = ""
+    if sorting == "popular":
+        join_sql, sort_query = popularity.popular_sort()
+    else:
+        sort_query = sort_options.get(sorting, "ORDER BY name ASC")
 
-    if selected_category_id:
-        where_clauses.append("categoryId = ?")
-        params.append(selected_category_id)
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    # La grille produits est identique pour tous les visiteurs : on la sert
+    # depuis le cache, seul l'en-tête (nom, panier) est rendu à chaque requête.
+    # La clé contient les versions des tables (table_versions), communes à
+    # tous les workers : une écriture dans l'un invalide le cache des autres.
+    version = None if is_ajax else catalog_version(sorting)
+    cache_key = (q, selected_category_id, sorting, tuple(facet_args(selected_facets)), version)
+    catalog_html = None if version is None else catalog_fragments.get(cache_key)
 
-    where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    if catalog_html is None:
+        where_clauses = []
+        params = []
 
-    with sqlite3.connect('database.db') as conn:
-        cur = conn.cursor()
+        if q:
+            where_clauses.append("name LIKE ?")
+            params.append(f"%{q}%")
 
-        query = f"""
-            SELECT productId, name, price, description, image, stock
-            FROM products
-            {where_sql}
-            {sort_query}
-        """
-        cur.execute(query, params)
-        product_rows = cur.fetchall()
+        if selected_category_id:
+            where_clauses.append("categoryId = ?")
+            params.append(selected_category_id)
 
-        cur.execute("SELECT categoryId, name FROM categories")
-        categoryData = cur.fetchall()
+        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
 
-    itemData = parse(product_rows)
+        with connect_db() as conn:
+            cur = conn.cursor()
 
-    # Si c'est une requête AJAX, retourner JSON
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({
-            'itemData': itemData,
-            'categoryData': categoryData,
-            'totalProducts': len(product_rows)
-        })
+            query = f"""
+                SELECT products.productId, name, price, description, image, stock
+                FROM products
+                {join_sql}
+                {where_sql}
+                {sort_query}
+            """
+            cur.execute(query, params)
+            product_rows = cur.fetchall()
+
+            cur.execute("SELECT categoryId, name FROM categories")
+            categoryData = cur.fetchall()
+
+        # Filtres par attributs : recherche et catégorie restent en SQL, les
+        # facettes filtrent le résultat avec l'index en mémoire (facets.py)
+        base = bitset(row[0] for row in product_rows) if q else None
+        matching, facets = facet_index.search(selected_facets, base, selected_category_id)
+        if selected_facets:
+            is_match = member_test(matching)
+            product_rows = [row for row in product_rows if is_match(row[0])]
+        toggle_links(facets, selected_facets)
+
+        itemData = parse(product_rows)
+
+        # Si c'est une requête AJAX, retourner JSON
+        if is_ajax:
+            return jsonify({
+                'itemData': itemData,
+                'categoryData': categoryData,
+                'facets': facets,
+                'totalProducts': len(product_rows)
+            })
+
+        catalog_html = render_template(
+            "_home_catalog.html",
+            itemData=itemData,
+            categoryData=categoryData,
+            facets=facets,
+            search=q,
+            selected_category_id=selected_category_id
+        )
+        if version is not None:
+            catalog_fragments.set(cache_key, catalog_html)
 
     # Sinon, retourner le template normal
     return render_template(
         "home.html",
-        itemData=itemData,
+        catalog_html=catalog_html,
         loggedIn=loggedIn,
         firstName=firstName,
         noOfItems=noOfItems,
-        categoryData=categoryData,
         search=q,
         selected_category_id=selected_category_id,
         user_type=user_type  
@@ -266,7 +363,7 @@ def root(sorting):
 
 
 def getUserSessionDetails():
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         if 'email' not in session:
             loggedIn = False
@@ -292,7 +389,7 @@ def getUserSessionDetails():
 
 @app.route("/add")
 def admin():
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT categoryId, name FROM categories")
         categories = cur.fetchall()
@@ -313,7 +410,7 @@ def addItem():
             filename = secure_filename(image.filename)
             image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
 
-        with sqlite3.connect('database.db') as conn:
+        with connect_db() as conn:
             try:
                 cur = conn.cursor()
                 cur.execute('''
@@ -328,7 +425,7 @@ def addItem():
 
 @app.route("/remove")
 def remove():
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute('SELECT productId, name, price, description, image, stock FROM products')
         data = cur.fetchall()
@@ -337,7 +434,7 @@ def remove():
 @app.route("/removeItem")
 def removeItem():
     productId = request.args.get('productId')
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         try:
             cur = conn.cursor()
             cur.execute('DELETE FROM products WHERE productId = ?', (productId,))
@@ -346,11 +443,21 @@ def removeItem():
             conn.rollback()
     return redirect(url_for('root'))
 
+@app.route("/suggest")
+def suggest():
+    # Suggestions de recherche (saisie semi-automatique), index en mémoire
+    q = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), SUGGEST_MAX_LIMIT)
+    products, categories = suggest_index.suggest(q, limit)
+    return jsonify({'products': products, 'categories': categories})
+
+
 @app.route("/displayCategory")
 def displayCategory():
     loggedIn, firstName, noOfItems = getLoginDetails()
-    categoryId = request.args.get("categoryId")
-    with sqlite3.connect('database.db') as conn:
+    categoryId = request.args.get("categoryId", type=int)
+    selected_facets = parse_facets(request.args.getlist(FACET_PARAM))
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("""
             SELECT p.productId, p.name, p.price, p.image, c.name
@@ -360,10 +467,16 @@ def displayCategory():
         """, (categoryId,))
         data = cur.fetchall()
     categoryName = data[0][4] if data else ""
+    matching, facets = facet_index.search(selected_facets, category_id=categoryId)
+    if selected_facets:
+        is_match = member_test(matching)
+        data = [row for row in data if is_match(row[0])]
     itemData = parse(data)
     return render_template(
         'displayCategory.html',
         data=itemData,
+        facets=toggle_links(facets, selected_facets),
+        categoryId=categoryId,
         loggedIn=loggedIn,
         firstName=firstName,
         noOfItems=noOfItems,
@@ -382,7 +495,7 @@ def editProfile():
     if 'email' not in session:
         return redirect(url_for('root'))
     loggedIn, firstName, noOfItems = getLoginDetails()
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT userId, email, firstName, lastName, address1, address2, zipcode, city, state, country, phone FROM users WHERE email = ?", (session['email'],))
         profileData = cur.fetchone()
@@ -395,7 +508,7 @@ def changePassword():
     if request.method == "POST":
         oldPassword = hashlib.md5(request.form['oldpassword'].encode()).hexdigest()
         newPassword = hashlib.md5(request.form['newpassword'].encode()).hexdigest()
-        with sqlite3.connect('database.db') as conn:
+        with connect_db() as conn:
             cur = conn.cursor()
             cur.execute("SELECT userId, password FROM users WHERE email = ?", (session['email'],))
             userId, password = cur.fetchone()
@@ -426,7 +539,7 @@ def updateProfile():
         state = request.form['state']
         country = request.form['country']
         phone = request.form['phone']
-        with sqlite3.connect('database.db') as conn:
+        with connect_db() as conn:
             try:
                 cur = conn.cursor()
                 cur.execute('''
@@ -504,20 +617,17 @@ def login():
 
 
 def ipp(email):
+    import requests  # chargé à la première connexion seulement (~60 ms d'import)
     try:
         ip = requests.get('https://api.ipify.org', timeout=3).text
     except:
         ip = '0.0.0.0'
 
-    conn = sqlite3.connect('database.db')
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET IP = ? WHERE email = ?", (ip, email))
-    conn.commit()
-    conn.close()
+    write_behind.add("UPDATE users SET IP = ? WHERE email = ?", (ip, email), key=('users.IP', email))
 
 
 def get_all_users():
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute("SELECT * FROM users WHERE type = 'acheteur'")
     users = cur.fetchall()
@@ -525,7 +635,7 @@ def get_all_users():
     return users
 
 def get_all_sellers():
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute("SELECT * FROM users WHERE type = 'vendeur'")
     sellers = cur.fetchall()
@@ -533,7 +643,7 @@ def get_all_sellers():
     return sellers
 
 def GET_ALL_TYPES():
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute("SELECT * FROM users")
     sellers = cur.fetchall()
@@ -542,7 +652,7 @@ def GET_ALL_TYPES():
 
 
 def get_all_categories():
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute("SELECT * FROM categories")
     categories = cur.fetchall()
@@ -550,25 +660,21 @@ def get_all_categories():
     return categories
 
 def add_category_to_db(name):
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute("INSERT INTO categories (name) VALUES (?)", (name,))
     con.commit()
     con.close()
 
 def delete_category_from_db(categoryId):
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute("DELETE FROM categories WHERE categoryId = ?", (categoryId,))
     con.commit()
     con.close()
 
 def delete_user_from_db(userId):
-    con = sqlite3.connect('database.db')
-    cur = con.cursor()
-    cur.execute("DELETE FROM users WHERE userId = ?", (userId,))
-    con.commit()
-    con.close()
+    deletions.delete('users', userId)
 
 
 @app.route('/admin')
@@ -617,7 +723,7 @@ def add_product():
         image_path = os.path.join('static/uploads', image.filename)
         image.save(image_path)
 
-        conn = sqlite3.connect('database.db')
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute('''INSERT INTO products (name, price, description, image, stock, categoryId, maker)
                           VALUES (?, ?, ?, ?, ?, ?, ?)''', 
@@ -628,7 +734,7 @@ def add_product():
         return redirect('/seller/home')  
 
     elif request.method == 'GET':
-        conn = sqlite3.connect('database.db')
+        conn = connect_db()
         conn.row_factory = sqlite3.Row  
         cursor = conn.execute('SELECT * FROM categories')
         categories = cursor.fetchall()
@@ -706,7 +812,7 @@ def productDescription():
     loggedIn, firstName, noOfItems = getLoginDetails()
     productId = request.args.get('productId')
 
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
 
@@ -720,6 +826,8 @@ def productDescription():
         if not productData:
             return "Produit introuvable", 404
 
+        popularity.record_view(productData["productId"])
+
         cur.execute('''
             SELECT 
               u.firstName    AS username,
@@ -742,6 +850,10 @@ def productDescription():
         vendeur_full_name = f"{vendeur['firstName']} {vendeur['lastName']}" if vendeur else None
         vendeur_email = vendeur["email"] if vendeur else None
 
+        boughtTogether = bought_together.for_product(cur, productData["productId"])
+        similarProducts = similar.for_product(cur, productData["productId"])
+        gallery = media.for_product(cur, productData["productId"])
+
     session['email_vendeur'] = vendeur_email
 
     return render_template(
@@ -753,7 +865,10 @@ def productDescription():
         noOfItems=noOfItems,
         email_vendeur=vendeur_email,
         nom_vendeur=vendeur_full_name,
-        ID_SELLER=productData["maker"]
+        ID_SELLER=productData["maker"],
+        boughtTogether=boughtTogether,
+        similarProducts=similarProducts,
+        gallery=gallery
     )
 
 
@@ -764,23 +879,27 @@ def addToCart():
     if 'email' not in session:
         return redirect(url_for('loginForm'))
     productId = int(request.args.get('productId'))
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT userId FROM users WHERE email = ?", (session['email'],))
         userId = cur.fetchone()[0]
-        try:
-            cur.execute("INSERT INTO kart (userId, productId) VALUES (?, ?)", (userId, productId))
-            conn.commit()
-        except:
-            conn.rollback()
+    try:
+        execute_write(insert_kart_item, userId, productId)
+        popularity.record_cart(productId)
+    except sqlite3.Error as e:
+        app.logger.error(f"SQLite error in addToCart: {e}")
     return redirect(url_for('root'))
 
+
+def insert_kart_item(cur, userId, productId):
+    cur.execute("INSERT INTO kart (userId, productId) VALUES (?, ?)", (userId, productId))
+
 @app.route("/cart")
 def cart():
     if 'email' not in session:
         return redirect(url_for('loginForm'))
     loggedIn, firstName, noOfItems = getLoginDetails()
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT userId FROM users WHERE email = ?", (session['email'],))
         userId = cur.fetchone()[0]
@@ -791,9 +910,11 @@ def cart():
              WHERE k.userId = ?
         ''', (userId,))
         products = cur.fetchall()
+        boughtTogether = bought_together.for_cart(cur, [row[0] for row in products])
     totalPrice = sum(row[2] for row in products)
     return render_template("cart.html",
                            products=products,
+                           boughtTogether=boughtTogether,
                            totalPrice=totalPrice,
                            loggedIn=loggedIn,
                            firstName=firstName,
@@ -804,7 +925,7 @@ def removeFromCart():
     if 'email' not in session:
         return redirect(url_for('loginForm'))
     productId = int(request.args.get('productId'))
-    with sqlite3.connect('database.db') as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT userId FROM users WHERE email = ?", (session['email'],))
         userId = cur.fetchone()[0]
@@ -821,7 +942,7 @@ def logout():
     return redirect(url_for('root'))
 
 def is_valid(email, password):
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute('SELECT email, password FROM users')
     data = cur.fetchall()
@@ -854,7 +975,7 @@ def register():
         user_type   = 'vendeur'  if role == 'seller' else 'acheteur'
         acceptation = 1          if user_type == 'vendeur' else 1
 
-        with sqlite3.connect('database.db') as con:
+        with connect_db() as con:
             try:
                 cur = con.cursor()
                 cur.execute('''
@@ -893,7 +1014,7 @@ def registrationForm():
 
 
 def getAllCategories():
-    conn = sqlite3.connect('database.db')
+    conn = connect_db()
     conn.row_factory = sqlite3.Row  
     cur = conn.cursor()
     cur.execute("SELECT * FROM categories")
@@ -933,23 +1054,26 @@ def edit_product(productId):
     return render_template('edit_product_modal.html', product=product, categories=categories)
 
 
-@app.route('/deleteProduct/<int:productId>', methods=['GET'])
+@app.route('/deleteProduct/<int:productId>', methods=['POST'])
 def delete_product(productId):
- 
+    if 'user_id' not in session:
+        return redirect(url_for('loginForm'))
+
     print(f"Deleting product with ID: {productId}")
 
-    deleteProduct(productId)
+    # Un vendeur ne peut supprimer que ses propres produits
+    owner = None if is_admin_user() else session['user_id']
+    if not deleteProduct(productId, owner):
+        flash("Produit introuvable.", "danger")
     
     print(f"Redirecting to: {url_for('seller_home')}")
     
     return redirect('/seller/home')  
 
 
-def deleteProduct(productId):
-    conn=sqlite3.connect("database.db")
-    cur = conn.cursor()
-    cur.execute("DELETE FROM products WHERE productId = ?", (productId,))
-    conn.commit()
+def deleteProduct(productId, owner=None):
+    # Le produit disparaît tout de suite, ses dépendances sont purgées en arrière-plan
+    return deletions.delete('products', productId, owner)
 
 
 
@@ -958,14 +1082,14 @@ def deleteProduct(productId):
 
 
 def getProductById(productId):
-    conn=sqlite3.connect("database.db")
+    conn=connect_db()
     cur = conn.cursor()
     cur.execute("SELECT * FROM products WHERE id = ?", (productId,))
     row = cur.fetchone()
     return dict(zip([d[0] for d in cur.description], row)) if row else None
 
 def updateProduct(productId, name, price, description, image, stock, categoryId):
-    conn=sqlite3.connect("database.db")
+    conn=connect_db()
     cur = conn.cursor()
     cur.execute("""
         UPDATE products SET name=?, price=?, description=?, image=?, stock=?, categoryId=?
@@ -1011,7 +1135,7 @@ def admin_delete_category(category_id):
     execute_admin("DELETE FROM categories WHERE categoryId=?", (category_id,))
 
 def admin_delete_user(user_id):
-    execute_admin("DELETE FROM users WHERE userId=?", (user_id,))
+    deletions.delete('users', user_id)
 
 def is_admin_user():
     return session.get("user_type") == "admin"
@@ -1091,11 +1215,9 @@ def accept_vendor(user_id):
 
 @app.route('/delete_user/<int:user_id>', methods=['POST'])
 def delete_user_post(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    if not is_admin_user():
+        return jsonify({'error': 'Admin privileges required'}), 403
+    admin_delete_user(user_id)
     return ('', 204)
 
 
@@ -1154,6 +1276,7 @@ def upload_documents():
 
 
 
+ORDERS_PAGE_SIZE = 10
 
 @app.route('/account/orders')
 def account_orders():
@@ -1169,11 +1292,50 @@ def account_orders():
         conn.close()
         return "Utilisateur introuvable", 404
 
-    cur.execute("SELECT * FROM orders WHERE userId = ? ORDER BY orderDate DESC", (user["userId"],))
+    # Pagination par curseur (date et id de la dernière commande affichée) :
+    # chaque page est une lecture d'index, quel que soit le nombre de commandes
+    before = request.args.get('before')
+    before_id = request.args.get('before_id', type=int)
+    if before and before_id is not None:
+        cur.execute('''
+            SELECT orderId, orderDate, total FROM orders
+             WHERE userId = ? AND (orderDate, orderId) < (?, ?)
+             ORDER BY orderDate DESC, orderId DESC
+             LIMIT ?
+        ''', (user["userId"], before, before_id, ORDERS_PAGE_SIZE + 1))
+    else:
+        cur.execute('''
+            SELECT orderId, orderDate, total FROM orders
+             WHERE userId = ?
+             ORDER BY orderDate DESC, orderId DESC
+             LIMIT ?
+        ''', (user["userId"], ORDERS_PAGE_SIZE + 1))
     orders = cur.fetchall()
+    has_more = len(orders) > ORDERS_PAGE_SIZE
+    orders = orders[:ORDERS_PAGE_SIZE]
+
+    # Lignes de toutes les commandes de la page en une seule requête
+    items = {order["orderId"]: [] for order in orders}
+    if items:
+        placeholders = ', '.join('?' for _ in items)
+        cur.execute(f'''
+            SELECT oi.orderId, oi.productId, oi.quantity, p.name, p.price, p.image
+              FROM order_items oi
+              LEFT JOIN products p ON p.productId = oi.productId
+             WHERE oi.orderId IN ({placeholders})
+             ORDER BY oi.orderId, oi.id
+        ''', list(items))
+        for row in cur.fetchall():
+            items[row["orderId"]].append(row)
     conn.close()
 
-    return render_template("account_orders.html", orders=orders)
+    next_page = None
+    if has_more:
+        last = orders[-1]
+        next_page = url_for('account_orders', before=last["orderDate"], before_id=last["orderId"])
+
+    return render_template("account_orders.html", orders=orders, items=items, next_page=next_page,
+                           newest_page=url_for('account_orders') if before else None)
 
 
 
@@ -1181,12 +1343,15 @@ def account_orders():
 
 @app.route('/delete_order', methods=['POST'])
 def delete_order():
-    data = request.get_json()
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Login required'}), 401
+    data = request.get_json(silent=True) or {}
     order_id = data.get('orderId')
-    conn = get_db_connection()
-    conn.execute('DELETE FROM orders WHERE orderId = ?', (order_id,))
-    conn.commit()
-    conn.close()
+    if not isinstance(order_id, int):
+        return jsonify({'success': False, 'error': 'orderId is required'}), 400
+    # Seules les commandes du client connecté peuvent être supprimées
+    if not deletions.delete('orders', order_id, owner=session['user_id']):
+        return jsonify({'success': False, 'error': 'Order not found'}), 404
     return jsonify({'success': True})
 
 
@@ -1199,7 +1364,7 @@ def allowed_message_file(filename, allowed_set):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_set
 
 def get_messages_with(user_email, current_email):
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute('''
         SELECT sender, receiver, content, file_path, file_type, timestamp FROM messages
@@ -1216,7 +1381,7 @@ def messages():
         return redirect(url_for('login'))
     current_email = session['email']
 
-    con = sqlite3.connect('database.db')
+    con = connect_db()
     cur = con.cursor()
     cur.execute('''
         SELECT * FROM users WHERE email != ? 
@@ -1255,6 +1420,26 @@ def get_messages():
 
     return jsonify(messages_list)
 
+def insert_message(cur, sender, receiver, content, file_path=None, file_type=None):
+    # Écrit tout de suite : la conversation est rechargée juste après l'envoi
+    cur.execute('''
+        INSERT INTO messages (sender, receiver, content, file_path, file_type)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (sender, receiver, content, file_path, file_type))
+
+
+def save_message(sender, receiver, content, file_path=None, file_type=None):
+    """
+    Insert the message; returns an error response when the database stays busy.
+    """
+    try:
+        execute_write(insert_message, sender, receiver, content, file_path, file_type)
+    except WriteTimeout:
+        app.logger.warning(f"send_message: database busy for {sender}")
+        return jsonify({"error": "Service temporarily unavailable, please retry"}), 503
+    return None
+
+
 @app.route('/send_message', methods=['POST'])
 def send_message():
     if 'email' not in session:
@@ -1284,14 +1469,9 @@ def send_message():
         file.save(save_path)
         relative_path = f'/static/uploads/{filename}'
 
-        con = sqlite3.connect('database.db')
-        cur = con.cursor()
-        cur.execute('''
-            INSERT INTO messages (sender, receiver, content, file_path, file_type)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (sender, receiver, content, relative_path, file_type))
-        con.commit()
-        con.close()
+        error = save_message(sender, receiver, content, relative_path, file_type)
+        if error:
+            return error
 
         return jsonify({"success": True})
 
@@ -1305,13 +1485,9 @@ def send_message():
     if not receiver or not content:
         return jsonify({"error": "Missing content or receiver"}), 400
 
-    con = sqlite3.connect('database.db')
-    cur = con.cursor()
-    cur.execute('''
-        INSERT INTO messages (sender, receiver, content) VALUES (?, ?, ?)
-    ''', (sender, receiver, content))
-    con.commit()
-    con.close()
+    error = save_message(sender, receiver, content)
+    if error:
+        return error
 
     return jsonify({"success": True})
 
@@ -1319,7 +1495,7 @@ def send_message():
 
 @app.route("/produit/<int:id>")
 def produit(id):
-    conn = sqlite3.connect("database.db")
+    conn = connect_db()
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
 
@@ -1336,5 +1512,7 @@ def produit(id):
     return render_template("produit.html", produit=produit)
 
 
+create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,71 @@
+import os
+import posixpath
+
+from flask import abort, current_app, redirect, send_from_directory, url_for
+
+import db
+
+# Product gallery (product_media: images and videos). Files stored in the
+# upload folder are served by /media/<mediaId> with byte ranges (206 Partial
+# Content, 416 for unsatisfiable ranges, If-Range) and conditional headers
+# (ETag / Last-Modified, 304), so video players seek and stream without
+# downloading the whole file. Media with an absolute URL are linked as is.
+
+# Uploaded media never change under the same name: let browsers keep them
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 86400))
+GALLERY_LIMIT = 50
+
+
+def _is_external(url):
+    return url.startswith(('http://', 'https://', '//'))
+
+
+def _upload_name(url):
+    # 'x.mp4', 'uploads/x.mp4' and '/static/uploads/x.mp4' all name x.mp4
+    path = posixpath.normpath(url.replace('\\', '/').lstrip('/'))
+    for prefix in ('static/uploads/', 'uploads/'):
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path
+
+
+def media_src(media_id, url):
+    return url if _is_external(url) else url_for('product_media_file', mediaId=media_id)
+
+
+def for_product(cur, product_id, limit=GALLERY_LIMIT):
+    """
+    Gallery of a product, in upload order: [{mediaId, mediaType, src}].
+    """
+    cur.execute('''
+        SELECT mediaId, url, mediaType
+          FROM product_media
+         WHERE productId = ? AND url IS NOT NULL AND url != ''
+         ORDER BY mediaId
+         LIMIT ?
+    ''', (product_id, limit))
+    return [{'mediaId': media_id, 'mediaType': media_type, 'src': media_src(media_id, url)}
+            for media_id, url, media_type in cur.fetchall()]
+
+
+def media_file(mediaId):
+    conn = db.connect_db()
+    try:
+        row = conn.execute("SELECT url FROM product_media WHERE mediaId = ?", (mediaId,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or not row[0]:
+        abort(404)
+    if _is_external(row[0]):
+        return redirect(row[0])
+    # send_from_directory refuses paths leaving the folder; conditional=True
+    # handles Range, If-Range, If-None-Match and If-Modified-Since
+    return send_from_directory(current_app.config['UPLOAD_FOLDER'], _upload_name(row[0]),
+                               conditional=True, etag=True, max_age=MEDIA_MAX_AGE)
+
+
+def init_media(app):
+    """
+    Register /media/<mediaId>.
+    """
+    app.add_url_rule('/media/<int:mediaId>', 'product_media_file', media_file)
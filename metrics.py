@@ -0,0 +1,224 @@
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, jsonify, request
+
+import db
+import rate_limit
+import write_behind
+from auth import is_admin_session
+
+# Per-route latency and SQL metrics, exposed in Prometheus text format at /metrics.
+# Updates are a few dict operations under one lock, cheap enough to stay on in production.
+# Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; admins can also read it
+# from their session. Without METRICS_TOKEN, only admins can.
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+CONNECT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        with registry.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        with registry.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ('le',)
+        for label_values, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, label_values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, label_values + ('+Inf',))} {count}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in self.metrics:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_latency = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method'))
+requests_total = registry.counter(
+    'http_requests_total', 'Requests by endpoint and status code.', ('endpoint', 'method', 'status'))
+sql_statements = registry.histogram(
+    'sqlite_statements_per_request', 'SQL statements executed per request.', ('endpoint',),
+    buckets=SQL_COUNT_BUCKETS)
+sql_seconds = registry.histogram(
+    'sqlite_time_per_request_seconds', 'Time spent in SQLite per request.', ('endpoint',))
+connect_seconds = registry.histogram(
+    'sqlite_connection_checkout_seconds', 'Time to obtain a SQLite connection.',
+    buckets=CONNECT_BUCKETS)
+write_lock_wait = registry.histogram(
+    'sqlite_write_lock_wait_seconds', 'Time a write waited for the SQLite write lock.')
+write_retries = registry.counter(
+    'sqlite_write_retries_total', 'Write attempts retried after SQLITE_BUSY.')
+write_timeouts = registry.counter(
+    'sqlite_write_timeouts_total', 'Writes abandoned after the write deadline.')
+
+write_behind_rows = registry.counter(
+    'write_behind_rows_total', 'Rows flushed by the write-behind buffer.', ('result',))
+write_behind_flushes = registry.counter(
+    'write_behind_flushes_total', 'Write-behind flush transactions.', ('result',))
+
+rate_limit_rejections = registry.counter(
+    'rate_limit_rejections_total', 'Requests rejected by the rate or concurrency limiter.',
+    ('endpoint', 'reason'))
+
+# SQL activity of the request handled by the current thread
+_current = threading.local()
+
+
+def _on_statement(sql, seconds, cursor):
+    stats = getattr(_current, 'stats', None)
+    if stats is not None:
+        if sql is not None:
+            stats[0] += 1
+        stats[1] += seconds
+
+
+def _on_connect(seconds):
+    connect_seconds.observe(seconds)
+
+
+def _on_write(wait, attempts, ok):
+    write_lock_wait.observe(wait)
+    if attempts > 1:
+        write_retries.inc(amount=attempts - 1)
+    if not ok:
+        write_timeouts.inc()
+
+
+def _on_write_behind_flush(rows, ok):
+    result = 'ok' if ok else 'error'
+    write_behind_rows.inc(result, amount=rows)
+    write_behind_flushes.inc(result)
+
+
+def _on_rate_limit_rejection(endpoint, reason):
+    rate_limit_rejections.inc(endpoint, reason)
+
+
+def _before_request():
+    _current.started = time.perf_counter()
+    _current.stats = [0, 0.0]
+
+
+def _after_request(response):
+    started = getattr(_current, 'started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    if endpoint != 'metrics':
+        elapsed = time.perf_counter() - started
+        statements, sql_time = _current.stats
+        request_latency.observe(elapsed, endpoint, request.method)
+        requests_total.inc(endpoint, request.method, response.status_code)
+        sql_statements.observe(statements, endpoint)
+        sql_seconds.observe(sql_time, endpoint)
+    _current.started = None
+    _current.stats = None
+    return response
+
+
+def _scrape_allowed():
+    auth_header = request.headers.get('Authorization', '')
+    if METRICS_TOKEN and auth_header.startswith('Bearer '):
+        return hmac.compare_digest(auth_header[len('Bearer '):].strip(), METRICS_TOKEN)
+    return is_admin_session()
+
+
+def metrics_view():
+    if not _scrape_allowed():
+        return jsonify({'error': 'Metrics token or admin privileges required'}), 403
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """
+    Register the request hooks, the SQLite listeners and the /metrics route.
+    """
+    db.add_statement_listener(_on_statement)
+    db.add_connect_listener(_on_connect)
+    db.add_write_listener(_on_write)
+    write_behind.add_flush_listener(_on_write_behind_flush)
+    rate_limit.add_rejection_listener(_on_rate_limit_rejection)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,157 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import db
+from write_behind import write_behind
+
+# Product popularity. Views (productDescription) and add-to-cart events are
+# summed in the write-behind buffer and upserted into product_stats in batches.
+# A background thread folds the counts of the last period into an exponentially
+# decayed score every POPULARITY_REFRESH_SECONDS, so the "popular" sort is a
+# plain ORDER BY score at read time (an index range scan for the top N).
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_HALF_LIFE_DAYS = float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', 7))
+POPULARITY_REFRESH_SECONDS = int(os.environ.get('POPULARITY_REFRESH_SECONDS', 300))
+VIEW_WEIGHT = 1.0
+CART_WEIGHT = 5.0
+# Scores decayed below this are reset to 0 so old products leave the scan
+MIN_SCORE = 0.01
+
+RECORD_SQL = '''
+    INSERT INTO product_stats (productId, views, carts, pendingViews, pendingCarts)
+    VALUES (?1, ?2, ?3, ?2, ?3)
+    ON CONFLICT(productId) DO UPDATE SET
+        views = views + excluded.views,
+        carts = carts + excluded.carts,
+        pendingViews = pendingViews + excluded.pendingViews,
+        pendingCarts = pendingCarts + excluded.pendingCarts
+'''
+
+# JOIN and ORDER BY clauses for queries on `products` (one lookup per row by
+# primary key, no correlated subquery); products never seen score 0
+POPULAR_JOIN = "LEFT JOIN product_stats s ON s.productId = products.productId"
+POPULAR_ORDER_BY = "ORDER BY COALESCE(s.score, 0) DESC, products.name ASC"
+
+# Top products read from idx_product_stats_score (CROSS JOIN keeps
+# product_stats as the outer loop), so LIMIT stops after `limit` index entries
+TOP_SCORED_SQL = '''
+    SELECT products.*, s.score AS popularity, s.views AS views, s.carts AS carts
+      FROM product_stats s
+     CROSS JOIN products ON products.productId = s.productId
+     WHERE s.score > 0
+     ORDER BY s.score DESC, products.name ASC
+     LIMIT ?
+'''
+# Remaining places, when fewer products have a score
+TOP_UNSCORED_SQL = f'''
+    SELECT products.*, 0 AS popularity, COALESCE(s.views, 0) AS views, COALESCE(s.carts, 0) AS carts
+      FROM products
+      {POPULAR_JOIN}
+     WHERE COALESCE(s.score, 0) <= 0
+     ORDER BY products.name ASC
+     LIMIT ?
+'''
+
+_lock = threading.Lock()
+_pid = None
+
+
+def popular_sort():
+    """
+    (JOIN, ORDER BY) clauses sorting a query on `products` by popularity.
+    """
+    _ensure_started()
+    return POPULAR_JOIN, POPULAR_ORDER_BY
+
+
+def top_products(cur, limit):
+    """
+    The `limit` most popular products with popularity, views and carts.
+    """
+    _ensure_started()
+    cur.execute(TOP_SCORED_SQL, (limit,))
+    rows = cur.fetchall()
+    if len(rows) < limit:
+        cur.execute(TOP_UNSCORED_SQL, (limit - len(rows),))
+        rows += cur.fetchall()
+    return rows
+
+
+def _sum_counts(queued, new):
+    return (queued[0], queued[1] + new[1], queued[2] + new[2])
+
+
+def record(product_id, views=0, carts=0):
+    _ensure_started()
+    write_behind.add(RECORD_SQL, (int(product_id), views, carts),
+                     key=('product_stats', int(product_id)), merge=_sum_counts)
+
+
+def record_view(product_id):
+    record(product_id, views=1)
+
+
+def record_cart(product_id):
+    record(product_id, carts=1)
+
+
+def refresh_scores(cur, now):
+    """
+    Decay every score to `now` and add the counts collected since the last
+    refresh. Runs at most once per POPULARITY_REFRESH_SECONDS across all
+    workers; returns False when another worker refreshed recently.
+    """
+    cur.execute("SELECT refreshedAt FROM popularity_refresh WHERE id = 1")
+    row = cur.fetchone()
+    last = row[0] if row else now
+    if now - last < POPULARITY_REFRESH_SECONDS:
+        return False
+
+    decay = 0.5 ** ((now - last) / (POPULARITY_HALF_LIFE_DAYS * 86400))
+    cur.execute('''
+        UPDATE product_stats
+           SET score = CASE WHEN score * ?1 + ?2 * pendingViews + ?3 * pendingCarts < ?4 THEN 0
+                            ELSE score * ?1 + ?2 * pendingViews + ?3 * pendingCarts END,
+               pendingViews = 0,
+               pendingCarts = 0
+         WHERE score > 0 OR pendingViews > 0 OR pendingCarts > 0
+    ''', (decay, VIEW_WEIGHT, CART_WEIGHT, MIN_SCORE))
+    cur.execute("INSERT OR REPLACE INTO popularity_refresh (id, refreshedAt) VALUES (1, ?)", (now,))
+    cur.execute('''
+        UPDATE table_versions
+           SET version = version + 1,
+               updatedAt = strftime('%Y-%m-%dT%H:%M:%SZ', 'now')
+         WHERE tableName = 'product_stats'
+    ''')
+    return True
+
+
+def _refresh_once():
+    write_behind.flush()
+    db.execute_write(refresh_scores, time.time())
+
+
+def _run():
+    while True:
+        try:
+            _refresh_once()
+        except sqlite3.Error as e:
+            logger.error(f"popularity refresh failed: {e}")
+        time.sleep(min(max(POPULARITY_REFRESH_SECONDS, 1), 60))
+
+
+def _ensure_started():
+    # One refresher thread per process, restarted in forked workers
+    global _pid
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        _pid = os.getpid()
+        threading.Thread(target=_run, name='popularity', daemon=True).start()
@@ -0,0 +1,176 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+import sqlite3
+from flask import has_request_context, jsonify, request
+
+import db
+from auth import is_admin_session
+
+# Slow-query log and N+1 detection. Statements slower than threshold_ms
+# (execute plus the fetchall/fetchmany calls stepping their rows) are logged
+# with their normalized SQL, calling endpoint and EXPLAIN QUERY PLAN. A request
+# running the same normalized statement n_plus_one_threshold times or more is
+# flagged. Toggle at runtime through /admin/queries.
+
+logger = logging.getLogger(__name__)
+
+config = {
+    'enabled': os.environ.get('QUERY_PROFILER', '0') == '1',
+    'threshold_ms': float(os.environ.get('QUERY_PROFILER_THRESHOLD_MS', 100)),
+    'n_plus_one_threshold': int(os.environ.get('QUERY_PROFILER_N_PLUS_ONE', 10)),
+}
+HISTORY_SIZE = 200
+
+slow_queries = deque(maxlen=HISTORY_SIZE)
+n_plus_one = deque(maxlen=HISTORY_SIZE)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+_current = threading.local()
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """
+    Replace literals by ?, collapse IN (?, ?, ...) lists and whitespace so that
+    the same statement issued with different values normalizes identically.
+    """
+    normalized = _STRING_RE.sub('?', sql)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _IN_LIST_RE.sub('(?...)', normalized)
+    return _SPACE_RE.sub(' ', normalized).strip()
+
+
+def explain(cursor, sql):
+    """
+    EXPLAIN QUERY PLAN of a statement, run on a plain (uninstrumented) cursor.
+    """
+    if cursor.parameters is None:
+        return None
+    try:
+        plan_cursor = sqlite3.Cursor(cursor.connection)
+        rows = plan_cursor.execute('EXPLAIN QUERY PLAN ' + sql, cursor.parameters).fetchall()
+        plan_cursor.close()
+    except sqlite3.Error as e:
+        return [f"unavailable: {e}"]
+    return [row[-1] for row in rows]
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return None
+
+
+def _on_statement(sql, seconds, cursor):
+    if not config['enabled'] or getattr(_current, 'explaining', False):
+        return
+
+    if sql is None:
+        # Fetch time of the cursor's current statement: rows stepped in
+        # fetchall/fetchmany count towards its total
+        state = getattr(cursor, '_profiled', None)
+        if state is None:
+            return
+        state['seconds'] += seconds
+        sql = state['sql']
+    else:
+        counts = getattr(_current, 'counts', None)
+        if counts is not None:
+            normalized = normalize_sql(sql)
+            counts[normalized] = counts.get(normalized, 0) + 1
+        state = {'sql': sql, 'seconds': seconds, 'entry': None}
+        cursor._profiled = state
+
+    elapsed_ms = state['seconds'] * 1000
+    if elapsed_ms < config['threshold_ms']:
+        return
+    if state['entry'] is not None:
+        # Already logged: keep its time up to date as more rows are fetched
+        state['entry']['elapsed_ms'] = round(elapsed_ms, 3)
+        return
+
+    normalized = normalize_sql(sql)
+    _current.explaining = True
+    try:
+        plan = explain(cursor, sql)
+    finally:
+        _current.explaining = False
+    entry = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'endpoint': _endpoint(),
+        'elapsed_ms': round(elapsed_ms, 3),
+        'sql': normalized,
+        'plan': plan,
+    }
+    state['entry'] = entry
+    slow_queries.append(entry)
+    logger.warning("slow query %.1f ms on %s: %s | plan: %s",
+                   elapsed_ms, entry['endpoint'], normalized, '; '.join(plan or []))
+
+
+def _before_request():
+    _current.counts = {} if config['enabled'] else None
+
+
+def _after_request(response):
+    counts = getattr(_current, 'counts', None)
+    _current.counts = None
+    if counts:
+        threshold = config['n_plus_one_threshold']
+        for sql, count in counts.items():
+            if count >= threshold:
+                entry = {
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'endpoint': _endpoint(),
+                    'count': count,
+                    'sql': sql,
+                }
+                n_plus_one.append(entry)
+                logger.warning("possible N+1 on %s: %d x %s", entry['endpoint'], count, sql)
+    return response
+
+
+def queries_view():
+    if not is_admin_session():
+        return jsonify({'error': 'Admin privileges required'}), 403
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if 'enabled' in data:
+            config['enabled'] = bool(data['enabled'])
+        try:
+            if 'threshold_ms' in data:
+                config['threshold_ms'] = max(float(data['threshold_ms']), 0.0)
+            if 'n_plus_one_threshold' in data:
+                config['n_plus_one_threshold'] = max(int(data['n_plus_one_threshold']), 2)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid threshold value'}), 400
+        if data.get('clear'):
+            slow_queries.clear()
+            n_plus_one.clear()
+
+    return jsonify({
+        'config': config,
+        'slow_queries': list(slow_queries),
+        'n_plus_one': list(n_plus_one),
+    })
+
+
+def init_query_profiler(app):
+    """
+    Register the SQLite listener, the request hooks and /admin/queries.
+    """
+    db.add_statement_listener(_on_statement)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/admin/queries', 'admin_queries', queries_view, methods=['GET', 'POST'])
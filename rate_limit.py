@@ -0,0 +1,188 @@
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, g, jsonify, make_response, request, session
+
+# Request admission control, in process. Expensive routes (bcrypt/MD5 logins
+# and sign-ups, message uploads, catalog search) take a token from a bucket
+# per client IP and one per user, refilled at a steady rate with some burst;
+# an empty bucket answers 429 with Retry-After. Every request also takes a
+# slot from a global concurrency limiter: when all slots stay busy for
+# RATE_LIMIT_QUEUE_SECONDS the request is shed with 503. Limits apply per
+# worker process. RATE_LIMIT_ENABLED in app.config (default: the RATE_LIMIT
+# environment variable) turns all of it off, e.g. for benchmarks.
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT', '1') not in ('0', 'false', 'off')
+RATE_LIMIT_MAX_CONCURRENT = int(os.environ.get('RATE_LIMIT_MAX_CONCURRENT', 32))
+RATE_LIMIT_QUEUE_SECONDS = float(os.environ.get('RATE_LIMIT_QUEUE_SECONDS', 0.2))
+# Buckets kept in memory; full (idle) ones are dropped past this
+MAX_BUCKETS = 100000
+EXEMPT_ENDPOINTS = {'static', 'metrics'}
+
+# ip / user: (burst, requests per minute), None for no limit on that key.
+# methods: limited methods (None: all). query_arg: only when that argument is set.
+# '<endpoint>:ajax' budgets, when present, apply instead to the page's own
+# XMLHttpRequest calls (each filter or sort change of a search is one).
+Budget = namedtuple('Budget', 'ip user methods query_arg', defaults=(None, None))
+
+ROUTE_BUDGETS = {
+    'api.api_login': Budget(ip=(10, 10), user=(5, 5)),
+    'api.api_signup': Budget(ip=(5, 3), user=None),
+    'login': Budget(ip=(10, 10), user=(5, 5), methods=('POST',)),
+    'register': Budget(ip=(5, 3), user=None, methods=('POST',)),
+    'send_message': Budget(ip=(30, 60), user=(20, 30)),
+    'root': Budget(ip=(20, 120), user=(20, 120), query_arg='query'),
+    'root:ajax': Budget(ip=(60, 600), user=(60, 600), query_arg='query'),
+}
+
+rejection_listeners = []
+
+
+def add_rejection_listener(listener):
+    """
+    listener(endpoint, reason) with reason 'ip', 'user' or 'concurrency'.
+    """
+    rejection_listeners.append(listener)
+
+
+class TokenBucketLimiter:
+
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}  # key -> [tokens, updated, burst, rate per second]
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, per_minute, now=None):
+        """
+        Take one token from the bucket of `key`. Returns 0 when allowed,
+        otherwise the seconds until a token is available.
+        """
+        now = time.monotonic() if now is None else now
+        rate = per_minute / 60.0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._prune(now)
+                tokens = float(burst)
+            else:
+                tokens = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            if tokens >= 1:
+                self._buckets[key] = [tokens - 1, now, burst, rate]
+                return 0
+            self._buckets[key] = [tokens, now, burst, rate]
+            return (1 - tokens) / rate
+
+    def _prune(self, now):
+        full = [key for key, (tokens, updated, burst, rate) in self._buckets.items()
+                if tokens + (now - updated) * rate >= burst]
+        for key in full:
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+limiter = TokenBucketLimiter()
+_slots = threading.BoundedSemaphore(RATE_LIMIT_MAX_CONCURRENT)
+
+
+def _after_fork():
+    # Each worker starts with its own budgets and free slots
+    global limiter, _slots
+    limiter = TokenBucketLimiter()
+    _slots = threading.BoundedSemaphore(RATE_LIMIT_MAX_CONCURRENT)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _client_ip():
+    # remote_addr only: X-Forwarded-For is set by the client unless a trusted
+    # proxy rewrites it (configure ProxyFix in that case)
+    return request.remote_addr or 'unknown'
+
+
+def _user_key():
+    # Logged-in user, or the account targeted by a login / sign-up attempt
+    email = session.get('email')
+    if not email:
+        data = request.get_json(silent=True) if request.is_json else request.form
+        if hasattr(data, 'get'):
+            email = data.get('email')
+    return str(email).strip().lower() if email else None
+
+
+def _is_ajax():
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def _reject(status, retry_after, endpoint, reason):
+    for listener in rejection_listeners:
+        listener(endpoint, reason)
+    if request.path.startswith('/api/') or request.is_json or _is_ajax():
+        message = 'Too many requests' if status == 429 else 'Server busy, retry later'
+        response = make_response(jsonify({'error': message}), status)
+    else:
+        message = ("Trop de requêtes, réessayez dans quelques secondes." if status == 429
+                   else "Serveur occupé, réessayez dans quelques secondes.")
+        response = make_response(message, status)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def check_budget(endpoint):
+    """
+    Take the request's tokens for `endpoint`; returns a 429 response when a
+    bucket is empty, None otherwise.
+    """
+    if _is_ajax() and f'{endpoint}:ajax' in ROUTE_BUDGETS:
+        endpoint = f'{endpoint}:ajax'
+    budget = ROUTE_BUDGETS.get(endpoint)
+    if budget is None:
+        return None
+    if budget.methods and request.method not in budget.methods:
+        return None
+    if budget.query_arg and not request.args.get(budget.query_arg, '').strip():
+        return None
+    if budget.ip:
+        wait = limiter.take(('ip', endpoint, _client_ip()), *budget.ip)
+        if wait:
+            return _reject(429, wait, endpoint, 'ip')
+    if budget.user:
+        user = _user_key()
+        if user:
+            wait = limiter.take(('user', endpoint, user), *budget.user)
+            if wait:
+                return _reject(429, wait, endpoint, 'user')
+    return None
+
+
+def _before_request():
+    endpoint = request.endpoint or 'unmatched'
+    if not current_app.config['RATE_LIMIT_ENABLED'] or endpoint in EXEMPT_ENDPOINTS:
+        return None
+    if not _slots.acquire(timeout=RATE_LIMIT_QUEUE_SECONDS):
+        return _reject(503, 1, endpoint, 'concurrency')
+    g.rate_limit_slot = True
+    return check_budget(endpoint)
+
+
+def _teardown_request(exc):
+    if g.pop('rate_limit_slot', False):
+        _slots.release()
+
+
+def init_rate_limit(app):
+    """
+    Register the admission hooks. Call after init_metrics so rejected
+    requests are still timed and counted.
+    """
+    app.config.setdefault('RATE_LIMIT_ENABLED', RATE_LIMIT_ENABLED)
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
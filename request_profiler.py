@@ -0,0 +1,187 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+
+from flask import abort, g, jsonify, request, send_from_directory
+
+from auth import is_admin_session
+
+# On-demand profiling of a single request. An admin adds the header
+# "X-Profile: cpu", "X-Profile: memory" or "X-Profile: cpu,memory" (or the
+# query flag ?_profile=...) and the request runs under cProfile and/or
+# tracemalloc. Results are kept in a ring of the PROFILE_RING_SIZE most
+# recent profiles in PROFILE_DIR and listed at /admin/profiles.
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_RING_SIZE = int(os.environ.get('PROFILE_RING_SIZE', 50))
+PROFILE_KINDS = {'cpu', 'memory'}
+TRACEMALLOC_FRAMES = 10
+
+PROFILE_FILE_RE = re.compile(r'^[\w.-]+\.(pstats|tracemalloc|json)$')
+
+# tracemalloc is process-wide: only one memory profile runs at a time
+_memory_lock = threading.Lock()
+_ring_lock = threading.Lock()
+_sequence = 0
+
+
+def requested_kinds():
+    flag = request.headers.get('X-Profile') or request.args.get('_profile') or ''
+    return {kind.strip().lower() for kind in flag.split(',')} & PROFILE_KINDS
+
+
+def _profile_id():
+    global _sequence
+    with _ring_lock:
+        _sequence += 1
+        sequence = _sequence
+    endpoint = re.sub(r'[^\w.-]', '_', request.endpoint or 'unmatched')
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{os.getpid()}-{sequence:04d}-{endpoint}"
+
+
+def _trim_ring():
+    with _ring_lock:
+        metas = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+        for meta in metas[:-PROFILE_RING_SIZE] if PROFILE_RING_SIZE else metas:
+            profile_id = meta[:-len('.json')]
+            for ext in ('.json', '.pstats', '.tracemalloc'):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, profile_id + ext))
+                except FileNotFoundError:
+                    pass
+
+
+def _before_request():
+    if request.endpoint and request.endpoint.startswith('admin_profile'):
+        return
+    kinds = requested_kinds()
+    if not kinds or not is_admin_session():
+        return
+
+    if 'memory' in kinds:
+        if _memory_lock.acquire(blocking=False):
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        else:
+            kinds.discard('memory')
+    profiler = None
+    if 'cpu' in kinds:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    g.request_profile = (kinds, profiler, time.perf_counter())
+
+
+def _finish_profile(response):
+    kinds, profiler, started = g.pop('request_profile')
+    elapsed = time.perf_counter() - started
+    snapshot = None
+    if profiler is not None:
+        profiler.disable()
+    if 'memory' in kinds:
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            _memory_lock.release()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = _profile_id()
+    files = []
+    if profiler is not None:
+        profiler.dump_stats(os.path.join(PROFILE_DIR, profile_id + '.pstats'))
+        files.append(profile_id + '.pstats')
+    if snapshot is not None:
+        snapshot.dump(os.path.join(PROFILE_DIR, profile_id + '.tracemalloc'))
+        files.append(profile_id + '.tracemalloc')
+
+    meta = {
+        'id': profile_id,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code if response is not None else None,
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'kinds': sorted(kinds),
+        'files': files,
+    }
+    if snapshot is not None:
+        meta['peak_memory_bytes'] = peak
+    with open(os.path.join(PROFILE_DIR, profile_id + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    _trim_ring()
+    return profile_id
+
+
+def _after_request(response):
+    if 'request_profile' in g:
+        response.headers['X-Profile-Id'] = _finish_profile(response)
+    return response
+
+
+def _teardown_request(exc):
+    # A view that raised skips after_request; still stop the profilers
+    if 'request_profile' in g:
+        _finish_profile(None)
+
+
+def render_text(name, limit=50):
+    """
+    Human-readable summary of a stored profile: top functions by cumulative
+    time for .pstats, top allocation sites for .tracemalloc.
+    """
+    path = os.path.join(PROFILE_DIR, name)
+    out = io.StringIO()
+    if name.endswith('.pstats'):
+        stats = pstats.Stats(path, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+    elif name.endswith('.tracemalloc'):
+        snapshot = tracemalloc.Snapshot.load(path)
+        for stat in snapshot.statistics('lineno')[:limit]:
+            out.write(f"{stat}\n")
+    else:
+        with open(path, encoding='utf-8') as f:
+            out.write(f.read())
+    return out.getvalue()
+
+
+def profiles_view():
+    if not is_admin_session():
+        return jsonify({'error': 'Admin privileges required'}), 403
+    profiles = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(PROFILE_DIR, name), encoding='utf-8') as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+    return jsonify({'ringSize': PROFILE_RING_SIZE, 'profiles': profiles})
+
+
+def profile_file_view(name):
+    if not is_admin_session():
+        return jsonify({'error': 'Admin privileges required'}), 403
+    if not PROFILE_FILE_RE.match(name) or not os.path.isfile(os.path.join(PROFILE_DIR, name)):
+        abort(404)
+    if request.args.get('format') == 'text':
+        return render_text(name), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
+
+def init_request_profiler(app):
+    """
+    Register the profiling hooks and the /admin/profiles routes.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/admin/profiles', 'admin_profiles', profiles_view)
+    app.add_url_rule('/admin/profiles/<name>', 'admin_profile_file', profile_file_view)
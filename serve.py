@@ -0,0 +1,163 @@
+"""
+Production server: runs create_app() under gunicorn.
+
+    python serve.py                          # start (defaults below)
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:8000
+    python serve.py reload                   # graceful reload of the running server
+    python serve.py stop                     # graceful stop
+
+Every option can also be set from the environment (SERVE_BIND,
+SERVE_WORKERS, SERVE_THREADS, ...). Defaults are chosen for SQLite: one
+worker process per core up to MAX_DEFAULT_WORKERS (reads scale with
+processes, writes are serialized by the database whatever the count), a
+few threads per worker for requests waiting on I/O, the database switched
+to WAL so readers never wait for the writer, and the app preloaded in the
+master so workers fork with it already imported.
+
+`reload` sends SIGHUP: gunicorn starts new workers and retires the old
+ones once their requests are done. With --preload the code is not
+re-imported on reload; restart (or run with --no-preload) to deploy new code.
+
+Needs gunicorn (pip install gunicorn; Linux/macOS). `python main.py` remains
+the development server.
+"""
+import argparse
+import os
+import signal
+import sqlite3
+import sys
+
+import db
+
+MAX_DEFAULT_WORKERS = 8
+
+
+def _env(name, default, kind=str):
+    value = os.environ.get(f'SERVE_{name}')
+    return default if value is None else kind(value)
+
+
+def _flag(name, default):
+    value = os.environ.get(f'SERVE_{name}')
+    return default if value is None else value.lower() not in ('0', 'false', 'no', 'off')
+
+
+def _add_switch(parser, name, default, help):
+    # --name / --no-name pair (argparse.BooleanOptionalAction needs Python 3.9)
+    dest = name.replace('-', '_')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(f'--{name}', dest=dest, action='store_true', help=help)
+    group.add_argument(f'--no-{name}', dest=dest, action='store_false')
+    parser.set_defaults(**{dest: default})
+
+
+def default_workers():
+    return max(1, min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS))
+
+
+def enable_wal(path):
+    """
+    Switch the database to WAL (persistent): readers keep going while a
+    write is in progress, and commits no longer rewrite the main file.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    finally:
+        conn.close()
+    return mode
+
+
+def gunicorn_options(args):
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread' if args.threads > 1 else 'sync',
+        'preload_app': args.preload,
+        'keepalive': args.keepalive,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'backlog': args.backlog,
+        'pidfile': args.pidfile,
+        'accesslog': args.access_log,
+        'errorlog': '-',
+        'proc_name': 'directshop',
+    }
+
+
+def run(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("serve.py needs gunicorn: pip install gunicorn")
+
+    class Server(BaseApplication):
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            from main import create_app
+            return create_app()
+
+    db.DATABASE = os.path.abspath(args.db)
+    if args.wal:
+        print(f"journal_mode={enable_wal(db.DATABASE)} for {db.DATABASE}")
+    Server(gunicorn_options(args)).run()
+
+
+def signal_server(pidfile, sig):
+    try:
+        with open(pidfile) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        sys.exit(f"no running server found ({pidfile})")
+    os.kill(pid, sig)
+    print(f"sent {signal.Signals(sig).name} to {pid}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run DirectShop under gunicorn.")
+    parser.add_argument('action', nargs='?', default='start', choices=('start', 'reload', 'stop'))
+    parser.add_argument('--bind', default=_env('BIND', '127.0.0.1:8000'))
+    parser.add_argument('--workers', type=int, default=_env('WORKERS', default_workers(), int),
+                        help="worker processes (default: one per core, at most %d)" % MAX_DEFAULT_WORKERS)
+    parser.add_argument('--threads', type=int, default=_env('THREADS', 4, int),
+                        help="threads per worker (default 4)")
+    _add_switch(parser, 'preload', _flag('PRELOAD', True),
+                "import the app in the master before forking (default on)")
+    parser.add_argument('--keepalive', type=int, default=_env('KEEPALIVE', 5, int),
+                        help="seconds to keep idle client connections open (default 5)")
+    parser.add_argument('--timeout', type=int, default=_env('TIMEOUT', 30, int),
+                        help="seconds before a silent worker is killed and replaced (default 30)")
+    parser.add_argument('--graceful-timeout', type=int, default=_env('GRACEFUL_TIMEOUT', 30, int),
+                        help="seconds workers get to finish requests on reload/stop (default 30)")
+    parser.add_argument('--max-requests', type=int, default=_env('MAX_REQUESTS', 0, int),
+                        help="recycle a worker after this many requests, with 10%% jitter (0: never)")
+    parser.add_argument('--backlog', type=int, default=_env('BACKLOG', 2048, int))
+    _add_switch(parser, 'wal', _flag('WAL', True),
+                "switch the database to WAL before starting (default on)")
+    parser.add_argument('--db', default=_env('DB', db.DATABASE), help="database path (default: database.db)")
+    parser.add_argument('--pidfile', default=_env('PIDFILE', 'directshop.pid'))
+    parser.add_argument('--access-log', default=_env('ACCESS_LOG', None), help="'-' for stdout")
+    args = parser.parse_args(argv)
+
+    if args.action == 'reload':
+        signal_server(args.pidfile, signal.SIGHUP)
+    elif args.action == 'stop':
+        signal_server(args.pidfile, signal.SIGTERM)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
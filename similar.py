@@ -0,0 +1,242 @@
+"""
+Content-based "similar products".
+
+Products are TF-IDF vectors over the words of their name (counted twice) and
+description, held in a SciPy sparse matrix with L2-normalized rows, so the
+cosine similarity of a batch of products with the whole catalog is one
+sparse matrix product. The TOP_K neighbours of each product are stored in
+similar_products, read by the product page and /api/products/<id>/similar.
+
+    python similar.py            # only products changed since the last run
+    python similar.py --full     # recompute every product
+
+An incremental run recomputes the neighbours of the changed products, of
+the products that listed one of them, and of the products they would now
+enter the top-K of. IDF weights come from the current catalog on each run.
+
+Rebuilding needs numpy and scipy (pip install numpy scipy); the web pages
+only read the table.
+"""
+import argparse
+import math
+import sys
+import time
+from collections import Counter
+
+import db
+from suggest import words
+
+TOP_K = 10
+# Rows multiplied against the whole catalog at once (bounds the memory of one product)
+BATCH_ROWS = 256
+# Terms present in more than this share of products carry no signal
+MAX_DF = 0.3
+MIN_SCORE = 0.05
+NAME_WEIGHT = 2
+
+STOPWORDS = frozenset('''
+    au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma mais me meme mes moi
+    mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une
+    vos votre vous est sont tres plus the and for with
+'''.split())
+
+
+def _numeric():
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        sys.exit("similar.py needs numpy and scipy to rebuild the index: pip install numpy scipy")
+    return numpy, sparse
+
+
+def terms(name, description):
+    result = []
+    for weight, text in ((NAME_WEIGHT, name), (1, description)):
+        for word in words(text):
+            if len(word) > 1 and not word.isdigit() and word not in STOPWORDS:
+                result.extend([word] * weight)
+    return result
+
+
+def tfidf_matrix(documents):
+    """
+    CSR matrix (products x terms) of L2-normalized TF-IDF rows, with
+    sublinear term frequency (1 + log tf).
+    """
+    np, sparse = _numeric()
+    vocabulary = {}
+    indptr, indices, data = [0], [], []
+    for document in documents:
+        for term, count in Counter(document).items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(1.0 + math.log(count))
+        indptr.append(len(indices))
+    n = len(documents)
+    matrix = sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(n, max(len(vocabulary), 1)))
+
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+    idf[df > MAX_DF * n] = 0
+    matrix.data *= idf[matrix.indices]
+    matrix.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr)).astype(np.float32)
+    return matrix
+
+
+def top_k(matrix, product_ids, rows):
+    """
+    {productId: [(otherId, score)]} for the given matrix rows, best first.
+    """
+    np, _ = _numeric()
+    transposed = matrix.T.tocsc()
+    result = {}
+    for start in range(0, len(rows), BATCH_ROWS):
+        batch = rows[start:start + BATCH_ROWS]
+        scores = (matrix[batch] @ transposed).tocsr()
+        for offset, row in enumerate(batch):
+            lo, hi = scores.indptr[offset], scores.indptr[offset + 1]
+            columns, values = scores.indices[lo:hi], scores.data[lo:hi]
+            keep = (columns != row) & (values >= MIN_SCORE)
+            columns, values = columns[keep], values[keep]
+            if len(values) > TOP_K:
+                best = np.argpartition(-values, TOP_K)[:TOP_K]
+                columns, values = columns[best], values[best]
+            order = np.lexsort((product_ids[columns], -values))
+            result[int(product_ids[row])] = [(int(product_ids[columns[i]]), float(values[i])) for i in order]
+    return result
+
+
+def _store(cur, neighbours, removed=()):
+    ids = list(neighbours) + list(removed)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ', '.join('?' for _ in chunk)
+        cur.execute(f"DELETE FROM similar_products WHERE productId IN ({placeholders})", chunk)
+    cur.executemany(
+        "INSERT INTO similar_products (productId, rank, otherId, score) VALUES (?, ?, ?, ?)",
+        ((product_id, rank, other_id, score)
+         for product_id, items in neighbours.items()
+         for rank, (other_id, score) in enumerate(items, 1)))
+
+
+def _finish(cur, seq, full):
+    if full:
+        cur.execute("DELETE FROM similar_products WHERE productId NOT IN (SELECT productId FROM products)")
+    cur.execute("UPDATE similar_state SET seq = ? WHERE id = 1", (seq,))
+    cur.execute('''
+        UPDATE table_versions
+           SET version = version + 1,
+               updatedAt = strftime('%Y-%m-%dT%H:%M:%SZ', 'now')
+         WHERE tableName = 'similar_products'
+    ''')
+
+
+def _affected_rows(conn, matrix, product_ids, index, changed):
+    """
+    Rows to recompute after `changed` products were inserted, edited or
+    deleted: the changed ones, products listing one of them, and products
+    whose current K-th neighbour scores below a changed product.
+    """
+    np, _ = _numeric()
+    affected = {pid for pid in changed if pid in index}
+    placeholders = ', '.join('?' for _ in changed)
+    affected.update(row[0] for row in conn.execute(
+        f"SELECT DISTINCT productId FROM similar_products WHERE otherId IN ({placeholders})", changed))
+
+    thresholds = np.full(len(product_ids), MIN_SCORE, dtype=np.float32)
+    for product_id, count, lowest in conn.execute(
+            "SELECT productId, COUNT(*), MIN(score) FROM similar_products GROUP BY productId"):
+        if count >= TOP_K and product_id in index:
+            thresholds[index[product_id]] = lowest
+    rows = [index[pid] for pid in changed if pid in index]
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(rows), BATCH_ROWS):
+        scores = (matrix[rows[start:start + BATCH_ROWS]] @ transposed).tocsr()
+        scores.data[scores.data <= thresholds[scores.indices]] = 0
+        scores.eliminate_zeros()
+        affected.update(int(product_ids[column]) for column in np.unique(scores.indices))
+    return affected
+
+
+def update(full=False):
+    """
+    Recompute similar products (all of them with full=True, otherwise those
+    affected by product changes since the last run). Returns the number of
+    products recomputed. Falls back to a full run when change_log no longer
+    holds every change since the last one.
+    """
+    np, _ = _numeric()
+    conn = db.connect_db()
+    try:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        last_seq = conn.execute("SELECT seq FROM similar_state WHERE id = 1").fetchone()[0]
+        purged_seq = conn.execute("SELECT purgedSeq FROM change_log_compaction WHERE id = 1").fetchone()
+        # Never run, or changes since the last run were compacted away
+        full = full or last_seq is None or (purged_seq is not None and purged_seq[0] > last_seq)
+        rows = conn.execute("SELECT productId, name, description FROM products ORDER BY productId").fetchall()
+        product_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        index = {int(pid): i for i, pid in enumerate(product_ids)}
+        matrix = tfidf_matrix([terms(name, description) for _, name, description in rows])
+
+        if full:
+            affected = set(index)
+            removed = []
+        else:
+            changed = sorted({row[0] for row in conn.execute(
+                "SELECT rowId FROM change_log WHERE tableName = 'products' AND seq > ? AND seq <= ?",
+                (last_seq, seq))})
+            if not changed:
+                db.execute_write(_finish, seq, False)
+                return 0
+            affected = set()
+            for start in range(0, len(changed), 500):
+                affected |= _affected_rows(conn, matrix, product_ids, index, changed[start:start + 500])
+            removed = [pid for pid in changed if pid not in index]
+    finally:
+        conn.close()
+
+    affected = sorted(pid for pid in affected if pid in index)
+    for start in range(0, len(affected), 2000):
+        chunk = [index[pid] for pid in affected[start:start + 2000]]
+        db.execute_write(_store, top_k(matrix, product_ids, chunk), removed if start == 0 else ())
+    if not affected and removed:
+        db.execute_write(_store, {}, removed)
+    db.execute_write(_finish, seq, full)
+    return len(affected)
+
+
+def for_product(cur, product_id, limit=6):
+    """
+    Most similar products to product_id: (productId, name, price, image).
+    """
+    cur.execute('''
+        SELECT p.productId, p.name, p.price, p.image
+          FROM similar_products sp
+          JOIN products p ON p.productId = sp.otherId
+         WHERE sp.productId = ?
+         ORDER BY sp.rank
+         LIMIT ?
+    ''', (product_id, limit))
+    return cur.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update content-based similar products.")
+    parser.add_argument('--full', action='store_true', help="recompute every product")
+    parser.add_argument('--db', help="database path (default: database.db)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.DATABASE = args.db
+    started = time.perf_counter()
+    count = update(full=args.full)
+    print(f"similar products recomputed for {count} products in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
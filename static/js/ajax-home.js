@@ -4,19 +4,29 @@ document.addEventListener('DOMContentLoaded', function() {
     const categoryLinks = document.querySelectorAll('.category-list a');
     const searchForm = document.querySelector('form[action*="request.path"]');
     const sortButtons = document.querySelectorAll('.sort-btn');
+    const facetsContainer = document.getElementById('facets-container');
     
     let currentParams = {
         query: '',
         category_id: null,
-        sorting: 'name_asc'
+        sorting: 'name_asc',
+        facets: []
     };
 
+    // Escape text inserted with innerHTML (attribute values and product names are free text)
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
     // Initialize current parameters from URL
     function initializeParams() {
         const urlParams = new URLSearchParams(window.location.search);
         currentParams.query = urlParams.get('query') || '';
         currentParams.category_id = urlParams.get('category_id') || null;
         currentParams.sorting = urlParams.get('sorting') || 'name_asc';
+        currentParams.facets = urlParams.getAll('facet');
     }
 
     // Show loading indicator
@@ -76,6 +86,7 @@ document.addEventListener('DOMContentLoaded', function() {
         if (currentParams.query) params.append('query', currentParams.query);
         if (currentParams.category_id) params.append('category_id', currentParams.category_id);
         if (currentParams.sorting) params.append('sorting', currentParams.sorting);
+        currentParams.facets.forEach(facet => params.append('facet', facet));
 
         // Construire l'URL avec le tri si nécessaire
         let url = '/';
@@ -94,6 +105,7 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 updateProducts(data);
+                updateFacets(data.facets || []);
                 updateActiveStates();
             })
             .catch(error => {
@@ -106,6 +118,39 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    // Rebuild the attribute filters (facets) with their counts
+    function updateFacets(facets) {
+        if (!facetsContainer) return;
+
+        let html = '';
+        facets.forEach(facet => {
+            let items = '';
+            facet.values.forEach(v => {
+                const params = new URLSearchParams();
+                if (currentParams.query) params.append('query', currentParams.query);
+                if (currentParams.category_id) params.append('category_id', currentParams.category_id);
+                v.toggle.forEach(f => params.append('facet', f));
+                const path = currentParams.sorting && currentParams.sorting !== 'name_asc' ? `/${currentParams.sorting}` : '/';
+                items += `
+                    <a href="${path}?${params.toString()}"
+                       class="list-group-item list-group-item-action d-flex justify-content-between ${v.selected ? 'active' : ''}">
+                        <span><i class="far ${v.selected ? 'fa-check-square' : 'fa-square'} me-2"></i>${escapeHtml(v.value)}</span>
+                        <span class="badge bg-secondary rounded-pill">${v.count}</span>
+                    </a>
+                `;
+            });
+            html += `
+                <div class="card card-sidebar shadow-sm mt-3">
+                    <div class="card-header text-capitalize">
+                        <i class="fas fa-sliders-h me-2"></i> ${escapeHtml(facet.name)}
+                    </div>
+                    <ul class="list-group list-group-flush facet-list">${items}</ul>
+                </div>
+            `;
+        });
+        facetsContainer.innerHTML = html;
+    }
+
     // Update active states for categories and sorting
     function updateActiveStates() {
         // Update category active states
@@ -139,6 +184,7 @@ document.addEventListener('DOMContentLoaded', function() {
             
             currentParams.category_id = categoryId;
             currentParams.query = url.searchParams.get('query') || '';
+            currentParams.facets = [];
             
             fetchProducts();
             
@@ -154,6 +200,7 @@ document.addEventListener('DOMContentLoaded', function() {
             } else {
                 newUrl.searchParams.delete('query');
             }
+            newUrl.searchParams.delete('facet');
             history.pushState({}, '', newUrl);
         });
     });
@@ -194,6 +241,58 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Search suggestions (typeahead) served by /suggest
+    const queryInput = document.querySelector('input[name="query"]');
+    if (queryInput) {
+        const suggestions = document.createElement('div');
+        suggestions.className = 'list-group position-absolute w-100 shadow-sm d-none';
+        suggestions.style.top = '100%';
+        suggestions.style.zIndex = 1050;
+        queryInput.parentElement.appendChild(suggestions);
+        queryInput.setAttribute('autocomplete', 'off');
+
+        let timer = null;
+        let controller = null;
+
+        function renderSuggestions(data) {
+            let html = '';
+            data.categories.forEach(cat => {
+                html += `<a class="list-group-item list-group-item-action" href="/?category_id=${cat.categoryId}">
+                            <i class="fas fa-tag me-2"></i>${escapeHtml(cat.name)}</a>`;
+            });
+            data.products.forEach(prod => {
+                html += `<a class="list-group-item list-group-item-action" href="/productDescription?productId=${prod.productId}">
+                            <i class="fas fa-search me-2"></i>${escapeHtml(prod.name)}</a>`;
+            });
+            suggestions.innerHTML = html;
+            suggestions.classList.toggle('d-none', html === '');
+        }
+
+        queryInput.addEventListener('input', function() {
+            clearTimeout(timer);
+            const q = this.value.trim();
+            if (!q) {
+                suggestions.classList.add('d-none');
+                return;
+            }
+            timer = setTimeout(() => {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                fetch(`/suggest?q=${encodeURIComponent(q)}`, { signal: controller.signal })
+                    .then(response => response.json())
+                    .then(renderSuggestions)
+                    .catch(error => {
+                        if (error.name !== 'AbortError') console.error('Error fetching suggestions:', error);
+                    });
+            }, 80);
+        });
+
+        queryInput.addEventListener('blur', () => {
+            // Let a click on a suggestion follow its link first
+            setTimeout(() => suggestions.classList.add('d-none'), 200);
+        });
+    }
+
     // Initialize
     initializeParams();
     
@@ -0,0 +1,286 @@
+import bisect
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import sqlite3
+
+import db
+
+# Typeahead suggestions. Product and category names are folded (accents
+# removed, case-folded: "Électronique" -> "electronique") and split into
+# words. Each word has a posting list of product ids sorted by rank
+# (popularity score, then stock); a prefix selects a range of the sorted
+# vocabulary and the ranked lists are merged lazily, so a lookup reads only
+# the first few ids. Product inserts, renames and stock changes are applied
+# from change_log; scores are reloaded in the background after each
+# popularity refresh. The index is built by a background thread started on
+# each worker's first request; until it is ready there are no suggestions.
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+CATEGORY_LIMIT = 5
+# Seconds between two checks of change_log / popularity_refresh
+SUGGEST_REFRESH_SECONDS = 1.0
+# Upper bound on ids read per lookup when extra words filter candidates out
+MAX_SCANNED = 5000
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def fold(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def words(text):
+    return _WORD_RE.findall(fold(text))
+
+
+class SuggestIndex:
+
+    def __init__(self):
+        self.vocabulary = []   # sorted distinct words
+        self.postings = {}     # word -> [productId] sorted by rank
+        self.ranks = {}        # word -> rank keys of postings[word], for bisect
+        self.products = {}     # productId -> (name, image, words, rank key)
+        self.categories = []   # (words, categoryId, name)
+        self.seq = None
+        self.refreshed_at = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._reloading = False
+
+    def _rank(self, product_id):
+        return self.products[product_id][3]
+
+    def build(self, conn):
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        seq = cur.fetchone()[0]
+        cur.execute("SELECT refreshedAt FROM popularity_refresh WHERE id = 1")
+        row = cur.fetchone()
+        refreshed_at = row[0] if row else None
+
+        products = {}
+        postings = {}
+        cur.execute('''
+            SELECT p.productId, p.name, p.image, p.stock, COALESCE(s.score, 0)
+              FROM products p
+              LEFT JOIN product_stats s ON s.productId = p.productId
+        ''')
+        for product_id, name, image, stock, score in cur:
+            product_words = set(words(name))
+            products[product_id] = (name, image, product_words, (-score, -(stock or 0), product_id))
+            for word in product_words:
+                postings.setdefault(word, []).append(product_id)
+        ranks = {}
+        for word, ids in postings.items():
+            ids.sort(key=lambda pid: products[pid][3])
+            ranks[word] = [products[pid][3] for pid in ids]
+
+        cur.execute("SELECT categoryId, name FROM categories ORDER BY name")
+        categories = [(set(words(name)), category_id, name) for category_id, name in cur.fetchall()]
+
+        with self._lock:
+            self.products = products
+            self.postings = postings
+            self.ranks = ranks
+            self.vocabulary = sorted(postings)
+            self.categories = categories
+            self.seq = seq
+            self.refreshed_at = refreshed_at
+
+    def _remove_product(self, product_id):
+        entry = self.products.get(product_id)
+        if entry is None:
+            return
+        for word in entry[2]:
+            ids = self.postings[word]
+            ranks = self.ranks[word]
+            index = bisect.bisect_left(ranks, entry[3])
+            if index >= len(ids) or ids[index] != product_id:
+                index = ids.index(product_id)
+            del ids[index]
+            del ranks[index]
+            if not ids:
+                del self.postings[word]
+                del self.ranks[word]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+        del self.products[product_id]
+
+    def _add_product(self, product_id, name, image, stock, score):
+        product_words = set(words(name))
+        rank = (-score, -(stock or 0), product_id)
+        self.products[product_id] = (name, image, product_words, rank)
+        for word in product_words:
+            ids = self.postings.get(word)
+            if ids is None:
+                ids = self.postings[word] = []
+                self.ranks[word] = []
+                bisect.insort(self.vocabulary, word)
+            ranks = self.ranks[word]
+            index = bisect.bisect_left(ranks, rank)
+            ids.insert(index, product_id)
+            ranks.insert(index, rank)
+
+    def _apply_changes(self, cur, last_seq):
+        cur.execute('''
+            SELECT DISTINCT rowId FROM change_log
+             WHERE seq > ? AND seq <= ? AND tableName = 'products'
+             ORDER BY rowId
+        ''', (self.seq, last_seq))
+        changed = [row[0] for row in cur.fetchall()]
+        rows = {}
+        for start in range(0, len(changed), 500):
+            chunk = changed[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            cur.execute(f'''
+                SELECT p.productId, p.name, p.image, p.stock, COALESCE(s.score, 0)
+                  FROM products p
+                  LEFT JOIN product_stats s ON s.productId = p.productId
+                 WHERE p.productId IN ({placeholders})
+            ''', chunk)
+            rows.update((row[0], row) for row in cur.fetchall())
+        with self._lock:
+            for product_id in changed:
+                self._remove_product(product_id)
+                if product_id in rows:
+                    self._add_product(*rows[product_id])
+            self.seq = last_seq
+
+    def _reload_in_background(self):
+        def run():
+            conn = db.connect_db()
+            try:
+                self.build(conn)
+            except sqlite3.Error as e:
+                logger.error(f"suggestion index reload failed: {e}")
+            finally:
+                conn.close()
+                self._reloading = False
+        self._reloading = True
+        threading.Thread(target=run, name='suggest-reload', daemon=True).start()
+
+    def _after_fork(self):
+        # A reload running in the parent does not exist in the child
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._reloading = False
+
+    def start(self):
+        """
+        Start building the index in the background unless it is built or
+        being built (registered as a before_request hook).
+        """
+        if self.seq is not None or self._reloading:
+            return
+        with self._refresh_lock:
+            if self.seq is None and not self._reloading:
+                self._reload_in_background()
+
+    def refresh(self):
+        """
+        At most every SUGGEST_REFRESH_SECONDS, apply product changes from
+        change_log. New popularity scores (or a compacted change_log)
+        trigger a full reload in the background while the current index
+        keeps serving.
+        """
+        if self.seq is None:
+            self.start()
+            return
+        if time.monotonic() - self.checked_at < SUGGEST_REFRESH_SECONDS:
+            return
+        with self._refresh_lock:
+            now = time.monotonic()
+            if now - self.checked_at < SUGGEST_REFRESH_SECONDS or self._reloading:
+                return
+            self.checked_at = now
+            conn = db.connect_db()
+            try:
+                cur = conn.cursor()
+                cur.execute('''
+                    SELECT (SELECT purgedSeq FROM change_log_compaction WHERE id = 1),
+                           (SELECT refreshedAt FROM popularity_refresh WHERE id = 1),
+                           (SELECT COALESCE(MAX(seq), 0) FROM change_log)
+                ''')
+                purged_seq, refreshed_at, last_seq = cur.fetchone()
+                if (purged_seq or 0) > self.seq or refreshed_at != self.refreshed_at:
+                    self._reload_in_background()
+                    return
+                if last_seq > self.seq:
+                    self._apply_changes(cur, last_seq)
+            except sqlite3.Error as e:
+                logger.error(f"suggestion index refresh failed: {e}")
+            finally:
+                conn.close()
+
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        """
+        Products whose words start with every word of `query` (best ranked
+        first) and matching categories.
+        """
+        query_words = words(query)
+        if not query_words:
+            return [], []
+        self.refresh()
+        if self.seq is None:
+            return [], []
+        with self._lock:
+            # Walk the posting lists of the most selective word, filter on the others
+            candidates = {}
+            for word in set(query_words):
+                start = bisect.bisect_left(self.vocabulary, word)
+                end = bisect.bisect_left(self.vocabulary, word + '\uffff', start)
+                candidates[word] = [self.postings[w] for w in self.vocabulary[start:end]]
+            primary = min(candidates, key=lambda w: sum(map(len, candidates[w])))
+            others = [w for w in query_words if w != primary]
+            lists = candidates[primary]
+
+            products = []
+            seen = set()
+            if len(lists) <= 1:
+                merged = iter(lists[0] if lists else ())
+            elif len(lists) > 32 and sum(map(len, lists)) <= MAX_SCANNED:
+                # Many short lists (e.g. numbers): one sort beats a wide heap merge
+                merged = iter(sorted(itertools.chain.from_iterable(lists), key=self._rank))
+            else:
+                merged = heapq.merge(*lists, key=self._rank)
+            for scanned, product_id in enumerate(merged):
+                if scanned >= MAX_SCANNED or len(products) >= limit:
+                    break
+                if product_id in seen:
+                    continue
+                seen.add(product_id)
+                name, image, product_words, _ = self.products[product_id]
+                if all(any(pw.startswith(w) for pw in product_words) for w in others):
+                    products.append({'productId': product_id, 'name': name, 'image': image})
+
+            categories = [
+                {'categoryId': category_id, 'name': name}
+                for category_words, category_id, name in self.categories
+                if all(any(cw.startswith(w) for cw in category_words) for w in query_words)
+            ][:CATEGORY_LIMIT]
+        return products, categories
+
+
+suggest_index = SuggestIndex()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=suggest_index._after_fork)
+
+
+def init_suggest(app):
+    """
+    Build the suggestion index in the background from each worker's first
+    request, so /suggest never waits for it.
+    """
+    app.before_request(suggest_index.start)
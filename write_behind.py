@@ -0,0 +1,162 @@
+import atexit
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+
+import db
+
+# Write-behind buffer for non-critical small writes (IP updates, view
+# counters), where a delayed or lost row is acceptable. Rows are queued in
+# memory and applied in one transaction every WRITE_BEHIND_INTERVAL_MS or as
+# soon as WRITE_BEHIND_BATCH rows are pending, instead of one connection and
+# one fsync per event. Pending rows are flushed at exit; a crash loses at most
+# one interval of writes.
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_INTERVAL_MS = int(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 100))
+WRITE_BEHIND_BATCH = int(os.environ.get('WRITE_BEHIND_BATCH', 500))
+WRITE_BEHIND_BACKLOG = int(os.environ.get('WRITE_BEHIND_BACKLOG', 10000))
+
+# Called as listener(rows, ok) after each flush attempt
+flush_listeners = []
+
+
+def add_flush_listener(listener):
+    flush_listeners.append(listener)
+
+
+def _apply(cur, items):
+    # Consecutive rows of the same statement go through one executemany
+    for sql, group in itertools.groupby(items, key=lambda item: item[0]):
+        cur.executemany(sql, [item[1] for item in group])
+
+
+class WriteBehindBuffer:
+    """
+    Pending writes keyed by `key` when given, so a later write to the same
+    key (e.g. the IP of one user) replaces the queued one, or is combined
+    with it by merge(old_params, new_params) (e.g. summed counters). When
+    the backlog is full the caller flushes inline, so memory stays bounded
+    without dropping rows while the database is healthy.
+    """
+
+    def __init__(self, interval_ms=WRITE_BEHIND_INTERVAL_MS, max_batch=WRITE_BEHIND_BATCH,
+                 max_backlog=WRITE_BEHIND_BACKLOG):
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_backlog = max_backlog
+        self.dropped = 0
+        self._pending = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, sql, params, key=None, merge=None):
+        self._ensure_started()
+        with self._lock:
+            if key is None:
+                key = next(self._sequence)
+            else:
+                queued = self._pending.pop(key, None)
+                if queued is not None and merge is not None:
+                    params = merge(queued[1], params)
+            self._pending[key] = (sql, params, merge)
+            pending = len(self._pending)
+        if pending >= self.max_backlog:
+            self.flush()
+        elif pending >= self.max_batch:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Apply every pending write in one transaction; returns the row count.
+        On failure the rows are put back in front of newer ones.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+            try:
+                db.execute_write(_apply, list(batch.values()))
+            except sqlite3.Error as e:
+                logger.error(f"write-behind flush of {len(batch)} rows failed: {e}")
+                self._requeue(batch)
+                for listener in flush_listeners:
+                    listener(len(batch), False)
+                return 0
+        for listener in flush_listeners:
+            listener(len(batch), True)
+        return len(batch)
+
+    def _requeue(self, batch):
+        with self._lock:
+            for key, (sql, params, merge) in self._pending.items():
+                queued = batch.pop(key, None)
+                if queued is not None and merge is not None:
+                    params = merge(queued[1], params)
+                batch[key] = (sql, params, merge)
+            overflow = len(batch) - self.max_backlog
+            if overflow > 0:
+                for key in list(itertools.islice(batch, overflow)):
+                    del batch[key]
+                self.dropped += overflow
+                logger.error(f"write-behind backlog full, dropped {overflow} oldest rows")
+            self._pending = batch
+
+    def _ensure_started(self):
+        # Started lazily and restarted in forked workers, which do not
+        # inherit the parent's thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("write-behind flush failed")
+
+    def _after_fork(self):
+        # Rows queued by the parent are the parent's to flush; locks may have
+        # been held by one of its threads when the process forked
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def stop(self):
+        """
+        Stop the flusher thread and flush what is left.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+write_behind = WriteBehindBuffer()
+atexit.register(write_behind.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=write_behind._after_fork)